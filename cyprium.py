@@ -33,6 +33,7 @@ import app.cli
 import app.cli.ui
 import app.cli.root
 import kernel.utils as utils
+import kernel.cache as cache
 
 
 if __name__ == "__main__":
@@ -43,9 +44,14 @@ if __name__ == "__main__":
                                      "as well as some cryptanalysis ones.")
     parser.add_argument('-d', '--debug', action="store_true", default=False,
                         help="Enable debug mode.")
+    parser.add_argument('--cache-stats', action="store_true", default=False,
+                        help="Print disk cache statistics (as JSON) on "
+                             "stderr at exit.")
 
     args = parser.parse_args()
     utils.DEBUG = args.debug
+    if args.cache_stats:
+        cache.dump_stats_at_exit()
 
     tree = app.cli.Tree(app.cli.root)
 
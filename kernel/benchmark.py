@@ -0,0 +1,311 @@
+########################################################################
+#                                                                      #
+#   Cyprium is a multifunction cryptographic, steganographic and       #
+#   cryptanalysis tool developped by members of The Hackademy.         #
+#   French White Hat Hackers Community!                                #
+#   cyprium.hackademics.fr                                             #                                                  #
+#   Authors: SAKAROV, mont29, afranck64                                #
+#   Contact: admin@hackademics.fr                                      #
+#   Forum: hackademics.fr                                              #
+#   Twitter: @hackademics_                                             #
+#                                                                      #
+#   Cyprium is free software: you can redistribute it and/or modify    #
+#   it under the terms of the GNU General Public License as published  #
+#   by the Free Software Foundation, either version 3 of the License,  #
+#   or any later version.                                              #
+#                                                                      #
+#   This program is distributed in the hope that it will be useful,    #
+#   but without any warranty; without even the implied warranty of     #
+#   merchantability or fitness for a particular purpose. See the       #
+#   GNU General Public License for more details.                       #
+#                                                                      #
+#   The terms of the GNU General Public License is detailed in the     #
+#   COPYING attached file. If not, see : http://www.gnu.org/licenses   #
+#                                                                      #
+########################################################################
+
+
+import sys
+import os
+import io
+import time
+import json
+import shutil
+import tempfile
+import contextlib
+import cProfile
+import tracemalloc
+
+import kernel.cache as cache
+import kernel.utils as utils
+import kernel.hunspell as hunspell
+import kernel.matchdic as matchdic
+import kernel.dicbundle as dicbundle
+
+__about__ = """
+Benchmark of dics processing, stage by stage and language by language:
+hashing, aff and dic parsing, words generation, MatchDic lists building,
+cache storing and loading.
+
+Each stage is run "cold" (doing the real work) and, when it makes sense,
+"warm" (getting its result from cache, as usual runs do). For each run,
+the time, peak memory (as seen by tracemalloc, in a second run so that
+timings are not affected) and number of produced items are reported.
+Optionally, a cProfile dump (pstats format) is written for each run.
+
+The benchmark runs against its own cache (a temporary one by default), so
+that it never evicts nor pollutes the user’s cached data.
+"""
+
+
+ZIP_DICS = hunspell.ZIP_DICS
+BENCH_PREFIX = "bench"
+
+
+def measure(func, memory=True, profile=None):
+    """
+    Calls func() (silently), and returns a (result, seconds, peak) tuple,
+    peak being the peak of memory allocated during the call (in bytes, from
+    a second call), or None if memory is False.
+    If profile is not None, it must be a path where to dump cProfile stats
+    of (yet another) call.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        t = time.perf_counter()
+        ret = func()
+        t = time.perf_counter() - t
+        peak = None
+        if memory:
+            tracemalloc.start()
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        if profile:
+            prof = cProfile.Profile()
+            prof.runcall(func)
+            prof.dump_stats(profile)
+    return ret, t, peak
+
+
+def _count(ret):
+    """
+    Number of items in a stage result (words, or sets of words...).
+    """
+    words_types = (set, matchdic.SortedWords)
+    if isinstance(ret, list) and ret and isinstance(ret[0], words_types):
+        return sum(len(s) for s in ret)
+    try:
+        return len(ret)
+    except TypeError:
+        return None
+
+
+def bench_dic(zip_arch, zip_path, uid, params, memory=True, profile_dir=None):
+    """
+    Runs all stages for given dic (uid) of zip_arch, returns a list of
+    (stage, mode, seconds, peak, count) tuples.
+    params are MatchDic.init() ones.
+    """
+    res = []
+
+    def run(stage, mode, func):
+        prof = None
+        if profile_dir:
+            prof = os.path.join(profile_dir,
+                                "{}.{}.{}.pstats".format(uid, stage, mode))
+        ret, t, peak = measure(func, memory, prof)
+        res.append((stage, mode, t, peak, _count(ret)))
+        return ret
+
+    aff_path, dic_path = uid + ".aff", uid + ".dic"
+    aff = zip_arch.read(aff_path)
+    dic = zip_arch.read(dic_path)
+    salt = hunspell.Hunspell._hash_salt
+    fingerprint = os.stat(zip_path).st_mtime_ns
+
+    # Hashing.
+    run("hash", "cold", lambda: (cache.cache.hashbytes(aff, salt),
+                                 cache.cache.hashbytes(dic, salt)))
+    h = hunspell.Hunspell()
+    h.reset(uid)
+    for name in (aff_path, dic_path):
+        h._hash_zip_member(zip_arch, name, fingerprint)  # Warm it up.
+    run("hash", "warm", lambda: [h._hash_zip_member(zip_arch, name,
+                                                    fingerprint)
+                                 for name in (aff_path, dic_path)])
+
+    # Parsing.
+    def _parse_aff():
+        h.reset(uid)
+        h.parse_aff(h.dics[uid], h._read_lines(uid, lambda: aff, True))
+        return h.dics[uid]["af_classes"]
+
+    def _parse_dic():
+        h.dics[uid]["compound_parts"] = {}
+        h.parse_dic(h.dics[uid], h._read_lines(uid, lambda: dic, False))
+        return h.dics[uid]["base_words"]
+
+    run("parse_aff", "cold", _parse_aff)
+    run("parse_dic", "cold", _parse_dic)
+    # Warm runs read from disk cache, as a new process would do.
+    def _load_dic():
+        cache.cache.memory.clear()
+        hw = hunspell.Hunspell()
+        hw.load_dic_zip(zip_path, (uid,))
+        return hw.dics[uid]["base_words"]
+
+    h.load_dic_zip(zip_path, (uid,))  # Warm up cache.
+    run("load_dic", "warm", _load_dic)
+
+    # Generating.
+    run("gen_words", "cold", lambda: list(h.gen_words(dics=(uid,))))
+
+    # MatchDic.
+    m = matchdic.MatchDic(h)
+    m.set_params(**params)
+    words = run("matchdic", "cold", lambda: m._build_words(uid))
+
+    def _init():
+        cache.cache.memory.clear()
+        mw = matchdic.MatchDic(h)
+        mw.init((uid,), **params)
+        return mw.ids[uid]
+
+    m.init((uid,), **params)  # Warm up cache.
+    run("matchdic", "warm", _init)
+
+    # Raw cache store/load (without in-memory tier).
+    key = (BENCH_PREFIX, uid)
+
+    def _load():
+        cache.cache.memory.clear()
+        return cache.cache[key]
+
+    try:
+        run("cache_store", "cold",
+            lambda: cache.cache.set(key, words) or words)
+        run("cache_load", "cold", _load)
+    finally:
+        if key in cache.cache:
+            del cache.cache[key]
+    return res
+
+
+@contextlib.contextmanager
+def bench_cache(path=None, stats=False):
+    """
+    Makes all cache users use a cache in path dir (or in a temporary dir,
+    removed afterward, if None) within that context.
+    If stats is True, its statistics are printed (as JSON, on stderr) when
+    leaving the context.
+    """
+    tmp = None
+    if path is None:
+        path = tmp = tempfile.mkdtemp(prefix="cyprium-bench-")
+    real = cache.cache._get_class()(path)
+    prev = cache.cache.swap(real)
+    try:
+        yield real
+    finally:
+        cache.cache.swap(prev)
+        if stats:
+            real.dump_stats()
+        real.close()
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+def bench(zip_path=ZIP_DICS, names=(), profile="upper_ascii", memory=True,
+          profile_dir=None, cache_dir=None, cache_stats=False):
+    """
+    Runs the benchmark over given dics (all in zip_path if empty), returns
+    a dict {uid: [(stage, mode, seconds, peak, count), ...]}.
+    The cache used is in cache_dir (a temporary one if None), its
+    statistics are printed at the end if cache_stats is True.
+    """
+    import zipfile
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+    ret = {}
+    with bench_cache(cache_dir, cache_stats), \
+         zipfile.ZipFile(zip_path) as zip_arch:
+        if not names:
+            names = sorted(f[:-4] for f in zip_arch.namelist()
+                           if f.endswith(".dic"))
+        for uid in names:
+            utils.printf("Benchmarking {}... ".format(uid), end="")
+            ret[uid] = bench_dic(zip_arch, zip_path, uid,
+                                 dicbundle.PROFILES[profile], memory,
+                                 profile_dir)
+            print("Done.")
+    return ret
+
+
+def print_report(res, f=sys.stdout):
+    """
+    Prints a human-readable table of bench() results.
+    """
+    print("{:<8} {:<12} {:<5} {:>10} {:>10} {:>10}"
+          "".format("dic", "stage", "mode", "time (ms)", "peak (Mo)",
+                    "count"), file=f)
+    for uid, rows in res.items():
+        for stage, mode, t, peak, count in rows:
+            print("{:<8} {:<12} {:<5} {:>10.1f} {:>10} {:>10}"
+                  "".format(uid, stage, mode, t * 1000,
+                            "-" if peak is None else
+                            "{:.1f}".format(peak / 1024 / 1024),
+                            "-" if count is None else count), file=f)
+
+
+def main():
+    # The argparse is much nicer than directly using sys.argv...
+    # Try 'program.py -h' to see! ;)
+
+    import argparse
+    parser = argparse.ArgumentParser(description=""
+                                     "Benchmark dics processing, stage by "
+                                     "stage.")
+    parser.add_argument('--debug', action="store_true", default=False,
+                        help="Enable debug mode.")
+    parser.add_argument('-z', '--zip', default=ZIP_DICS,
+                        help="The zip archive of Hunspell dics to use.")
+    parser.add_argument('-d', '--dics', nargs="*", default=(),
+                        help="The dics to benchmark (all if not given).")
+    parser.add_argument('-p', '--profile', default="upper_ascii",
+                        choices=sorted(dicbundle.PROFILES),
+                        help="The MatchDic pre-processing profile to use.")
+    parser.add_argument('--no-memory', action="store_true", default=False,
+                        help="Do not measure peak memory (twice quicker).")
+    parser.add_argument('--pstats-dir',
+                        help="A dir where to write cProfile dumps of each "
+                             "stage.")
+    parser.add_argument('--cache-dir',
+                        help="The cache dir to use (a temporary one by "
+                             "default, never the user’s one).")
+    parser.add_argument('--cache-stats', action="store_true", default=False,
+                        help="Print statistics (as JSON) of the cache used "
+                             "by the benchmark on stderr at the end.")
+    parser.add_argument('-o', '--ofile', type=argparse.FileType('w'),
+                        help="A file into which write results as JSON "
+                             "(e.g. to track regressions).")
+    parser.add_argument('--about', action="store_true", default=False,
+                        help="About this benchmark…")
+
+    args = parser.parse_args()
+    utils.DEBUG = args.debug
+
+    if args.about:
+        print(__about__)
+        return
+
+    res = bench(args.zip, args.dics, args.profile, not args.no_memory,
+                args.pstats_dir, args.cache_dir, args.cache_stats)
+    print_report(res)
+    if args.ofile:
+        json.dump({uid: [dict(zip(("stage", "mode", "time", "peak",
+                                   "count"), r)) for r in rows]
+                   for uid, rows in res.items()}, args.ofile, indent=1)
+
+
+if __name__ == "__main__":
+    main()
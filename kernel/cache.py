@@ -26,10 +26,23 @@
 
 
 import os
+import collections
 import pickle
+import struct
+import zlib
 import hashlib
-import functools
 import shutil
+import mmap
+import atexit
+import multiprocessing.util
+import time
+import json
+import sys
+
+try:
+    import lzma
+except ImportError:  # Python may be built without it…
+    lzma = None
 
 import settings
 import kernel.utils as utils
@@ -37,11 +50,459 @@ import kernel.utils as utils
 
 CCH_DIR = settings.CCH_BASE_DIR
 CCH_MAX_SIZE = settings.CCH_MAX_SIZE * 1024 * 1024  # Given in Mo…
+CCH_LOW_SIZE = int(CCH_MAX_SIZE * settings.CCH_LOW_WATER)
+CCH_BACKEND = settings.CCH_BACKEND
+CCH_SINGLE_FLIGHT = settings.CCH_SINGLE_FLIGHT
+CCH_MEM_MAX_SIZE = settings.CCH_MEM_MAX_SIZE * 1024 * 1024  # Given in Mo…
+CCH_COMPRESS = settings.CCH_COMPRESS
+CCH_COMPRESS_MIN_SIZE = settings.CCH_COMPRESS_MIN_SIZE * 1024  # Given in Ko…
 
 HASH_TYPE = settings.CCH_HASH_TYPE
 HASH_READ_CHUNK = 65536
 
 
+class HashDigest(object):
+    """
+    An already computed hash value, mimicking the read-only part of hashlib’s
+    hash objects (so that it can e.g. be used as key element).
+    """
+
+    def __init__(self, digest):
+        self._digest = bytes(digest)
+
+    def digest(self):
+        return self._digest
+
+    def hexdigest(self):
+        return self._digest.hex()
+
+
+###############################################################################
+# Serialization codecs.
+###############################################################################
+# Cached blobs start with that magic and their codec's id byte (blobs without
+# it are considered as plain pickles, as written by older versions).
+CODEC_MAGIC = b"CyC"
+
+
+class PickleCodec(object):
+    """
+    Default codec, using highest pickle protocol, with out-of-band buffers
+    (i.e. big binary buffers are stored raw after the pickle stream, and
+    given back as views over the read data, without extra copies).
+    Blob layout: number of buffers, their lengths, pickle stream's length,
+    pickle stream, buffers.
+    """
+    uid = 1
+    name = "pickle"
+
+    @staticmethod
+    def accepts(data):
+        return True
+
+    @staticmethod
+    def dumps(data):
+        bufs = []
+        pck = pickle.dumps(data, pickle.HIGHEST_PROTOCOL,
+                           buffer_callback=bufs.append)
+        bufs = [b.raw() for b in bufs]
+        head = struct.pack("<I{}QQ".format(len(bufs)), len(bufs),
+                           *(b.nbytes for b in bufs), len(pck))
+        return [head, pck] + bufs
+
+    @staticmethod
+    def loads(buf):
+        nbr, = struct.unpack_from("<I", buf)
+        lens = struct.unpack_from("<{}QQ".format(nbr), buf, 4)
+        offset = 4 + 8 * (nbr + 1)
+        bufs = []
+        for ln in lens:
+            bufs.append(buf[offset:offset + ln])
+            offset += ln
+        return pickle.loads(bufs[-1], buffers=bufs[:-1])
+
+
+class WordSetsCodec(object):
+    """
+    Compact codec for lists of sets of strings (like MatchDic's lists of
+    words, which are by far the biggest cached objects).
+    Each set is stored as its sorted words, NULL-joined, utf-8-encoded,
+    all of them in a single buffer.
+    Blob layout: number of sets, their lengths, sets' data.
+    """
+    uid = 2
+    name = "wordsets"
+    _sep = "\0"
+
+    @classmethod
+    def accepts(cls, data):
+        return (isinstance(data, list) and
+                all(isinstance(s, (set, frozenset)) for s in data) and
+                all(isinstance(w, str) and cls._sep not in w
+                    for s in data for w in s))
+
+    @classmethod
+    def _encode_set(cls, s):
+        if s == {""}:
+            # Would be encoded as an empty set, else.
+            return cls._sep.encode("utf-8")
+        return cls._sep.join(sorted(s)).encode("utf-8")
+
+    @classmethod
+    def _decode_set(cls, b):
+        if not b:
+            return set()
+        return set(str(b, "utf-8").split(cls._sep))
+
+    @classmethod
+    def dumps(cls, data):
+        blocks = [cls._encode_set(s) for s in data]
+        head = struct.pack("<I{}Q".format(len(blocks)), len(blocks),
+                           *(len(b) for b in blocks))
+        return [head] + blocks
+
+    @classmethod
+    def loads(cls, buf):
+        nbr, = struct.unpack_from("<I", buf)
+        lens = struct.unpack_from("<{}Q".format(nbr), buf, 4)
+        offset = 4 + 8 * nbr
+        ret = []
+        for ln in lens:
+            ret.append(cls._decode_set(buf[offset:offset + ln]))
+            offset += ln
+        return ret
+
+
+class FrontCodedWordSetsCodec(WordSetsCodec):
+    """
+    Same as WordSetsCodec, but sorted words are front-coded (each word only
+    stores the length of the prefix it shares with the previous one, as a
+    single char, and its remaining chars).
+    This is two to three times smaller on disk, but about four times slower
+    to load than WordSetsCodec (decoding has to be done word by word), so
+    it is never automatically selected.
+    """
+    uid = 3
+    name = "wordsets_fc"
+
+    @classmethod
+    def accepts(cls, data):
+        return False
+
+    @classmethod
+    def _encode_set(cls, s):
+        ret = []
+        prev = ""
+        for w in sorted(s):
+            ln = min(len(w), len(prev))
+            i = 0
+            while i < ln and w[i] == prev[i]:
+                i += 1
+            # + 1 so that we never generate a NULL char!
+            ret.append(chr(i + 1) + w[i:])
+            prev = w
+        return cls._sep.join(ret).encode("utf-8")
+
+    @classmethod
+    def _decode_set(cls, b):
+        if not b:
+            return set()
+        ret = []
+        prev = ""
+        for w in str(b, "utf-8").split(cls._sep):
+            prev = prev[:ord(w[0]) - 1] + w[1:]
+            ret.append(prev)
+        return set(ret)
+
+
+# All known codecs, by name and uid.
+CODECS = {c.name: c for c in (PickleCodec, WordSetsCodec,
+                              FrontCodedWordSetsCodec)}
+_CODECS_IDS = {c.uid: c for c in CODECS.values()}
+
+# Codecs tried (in that order) when none is specified.
+AUTO_CODECS = (WordSetsCodec, PickleCodec)
+
+
+###############################################################################
+# Compressions.
+###############################################################################
+# Compressed blobs start with that magic, their compression's id byte, and
+# their uncompressed size (as an unsigned 64bits int).
+COMPRESS_MAGIC = b"CyZ"
+COMPRESS_CHUNK = 1024 * 1024
+
+# name: (uid, compressor factory, decompressor factory).
+COMPRESSIONS = {"zlib": (1, zlib.compressobj, zlib.decompressobj)}
+if lzma:
+    COMPRESSIONS["lzma"] = (2, lzma.LZMACompressor, lzma.LZMADecompressor)
+_COMPRESSIONS_IDS = {v[0]: (k,) + v[1:] for k, v in COMPRESSIONS.items()}
+_COMPRESSIONS_ERRORS = (zlib.error, lzma.LZMAError) if lzma else (zlib.error,)
+
+
+class CorruptedDataError(ValueError):
+    """
+    Raised when a cached blob cannot be decompressed (truncated or
+    corrupted data).
+    """
+
+
+def compress(chunks, name):
+    """
+    Compresses given list of bytes-like chunks with given compression, and
+    returns a new list of chunks.
+    """
+    uid, comp, decomp = COMPRESSIONS[name]
+    comp = comp()
+    ret = [COMPRESS_MAGIC + struct.pack("<BQ", uid, sum(len(c)
+                                                        for c in chunks))]
+    for c in chunks:
+        c = comp.compress(c)
+        if c:
+            ret.append(c)
+    ret.append(comp.flush())
+    return ret
+
+
+def decompress(buf):
+    """
+    Decompresses given bytes-like buffer, if it is a compressed one (else
+    just returns it).
+    Decompression is streamed from the input buffer (which can be e.g. a
+    view over a memory-mapped file) into a pre-allocated output one, so that
+    no intermediate copy of the whole data is ever needed.
+    Raises CorruptedDataError if data does not decompress to the expected
+    size.
+    """
+    buf = memoryview(buf)
+    hlen = len(COMPRESS_MAGIC)
+    if buf[:hlen] != COMPRESS_MAGIC:
+        return buf
+    uid, size = struct.unpack_from("<BQ", buf, hlen)
+    name, comp, decomp = _COMPRESSIONS_IDS[uid]
+    decomp = decomp()
+    ret = bytearray(size)
+    pos = 0
+    try:
+        for i in range(hlen + 9, len(buf), COMPRESS_CHUNK):
+            c = decomp.decompress(buf[i:i + COMPRESS_CHUNK])
+            if pos + len(c) > size:
+                break
+            ret[pos:pos + len(c)] = c
+            pos += len(c)
+        else:
+            # lzma decompressors have nothing to flush, only an eof flag.
+            if hasattr(decomp, "flush"):
+                c = decomp.flush()
+                ret[pos:pos + len(c)] = c
+                pos += len(c)
+    except _COMPRESSIONS_ERRORS as e:
+        raise CorruptedDataError("Invalid compressed data ({}).".format(e))
+    if pos != size or not decomp.eof:
+        raise CorruptedDataError("Compressed data does not match its size "
+                                 "({} bytes instead of {}).".format(pos,
+                                                                    size))
+    return memoryview(ret)
+
+
+def get_raw_size(chunks):
+    """
+    Returns the uncompressed size of given list of bytes-like chunks (as
+    returned by encode()).
+    """
+    hlen = len(COMPRESS_MAGIC)
+    if bytes(chunks[0][:hlen]) != COMPRESS_MAGIC:
+        return sum(len(c) for c in chunks)
+    return struct.unpack_from("<BQ", chunks[0], hlen)[1]
+
+
+def get_compression(buf):
+    """
+    Returns the name of the compression used by given buffer, if any.
+    """
+    hlen = len(COMPRESS_MAGIC)
+    if bytes(buf[:hlen]) != COMPRESS_MAGIC:
+        return None
+    return _COMPRESSIONS_IDS[buf[hlen]][0]
+
+
+def encode(data, codec=None, compression=None):
+    """
+    Serializes data with given codec (name), or the first one accepting it
+    from AUTO_CODECS.
+    Result is then compressed with given compression (name, see
+    COMPRESSIONS), or if None, with CCH_COMPRESS one when it is bigger than
+    CCH_COMPRESS_MIN_SIZE (False to disable compression).
+    Returns a list of bytes-like chunks.
+    """
+    if codec is None:
+        codec = next(c for c in AUTO_CODECS if c.accepts(data))
+    else:
+        codec = CODECS[codec]
+    ret = [CODEC_MAGIC + bytes((codec.uid,))] + codec.dumps(data)
+    if compression is None and CCH_COMPRESS:
+        if sum(len(c) for c in ret) >= CCH_COMPRESS_MIN_SIZE:
+            compression = CCH_COMPRESS
+    if compression:
+        ret = compress(ret, compression)
+    return ret
+
+
+def decode(buf):
+    """
+    Deserializes data from given bytes-like buffer (decompressing it first
+    if needed).
+    """
+    buf = decompress(buf)
+    hlen = len(CODEC_MAGIC)
+    if buf[:hlen] != CODEC_MAGIC:
+        return pickle.loads(buf)
+    return _CODECS_IDS[buf[hlen]].loads(buf[hlen + 1:])
+
+
+###############################################################################
+# Cross-process locking.
+###############################################################################
+try:
+    import fcntl
+except ImportError:  # Not available on Windows…
+    fcntl = None
+
+
+class FileLock(object):
+    """
+    A simple, re-entrant, cross-process exclusive lock, using flock() over
+    given (lock) file.
+    On platforms without fcntl, it is a no-op (i.e. concurrent use of a same
+    cache dir by several processes is not safe there).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+        self._depth = 0
+
+    def __enter__(self):
+        if not self._depth and fcntl:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        self._depth += 1
+        return self
+
+    def __exit__(self, *args):
+        self._depth -= 1
+        if not self._depth and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+###############################################################################
+# Caches.
+###############################################################################
+class CacheStats(object):
+    """
+    Counters about the usage of a cache, since its creation (or last reset).
+    Times are in seconds, "codec" ones are spent (de)serializing objects,
+    "io" ones are spent reading/writing them from/to disk.
+    """
+
+    _fields = ("hits", "misses", "builds", "reads", "writes", "evictions",
+               "bytes_read", "bytes_written", "time_read_io",
+               "time_read_codec", "time_write_io", "time_write_codec",
+               "time_build")
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        for f in self._fields:
+            setattr(self, f, 0)
+
+    def to_dict(self):
+        return {f: getattr(self, f) for f in self._fields}
+
+
+# Approximated memory used by each word of a set, on top of its serialized
+# chars (str object header, set slot, hash table's free slots…).
+MEM_WORD_OVERHEAD = 100
+
+
+def estimate_size(data, raw_size):
+    """
+    Returns an approximation of the memory used by data, deserialized from
+    raw_size (uncompressed) bytes.
+    Computing the real memory footprint of e.g. huge sets of words would
+    cost nearly as much as loading them, so only the number of words is
+    taken into account in addition to raw_size.
+    """
+    if isinstance(data, list) and \
+       all(isinstance(s, (set, frozenset)) for s in data):
+        return raw_size + MEM_WORD_OVERHEAD * sum(map(len, data))
+    return raw_size
+
+
+class MemoryCache(object):
+    """
+    A bounded, in-process LRU store of already deserialized objects.
+    Objects are stored with their serialized (on-disk) size, used to check
+    they are still up to date, and their approximated memory cost (see
+    estimate_size()), which is what is accounted against max_size.
+    Note objects are shared, never modify an object got from the cache!
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        # key -> (object, size, cost).
+        self._objs = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._objs)
+
+    def get(self, key, size):
+        """
+        Returns object stored under key, if it has expected size, else raises
+        KeyError.
+        """
+        obj, sz, cost = self._objs.get(key, (None, None, None))
+        if sz is None or sz != size:
+            self.misses += 1
+            raise KeyError()
+        self._objs.move_to_end(key)
+        self.hits += 1
+        return obj
+
+    def put(self, key, obj, size, cost=None):
+        """
+        Stores an object of given size and memory cost (defaults to size),
+        removing least-recently-used ones if needed.
+        """
+        self.discard(key)
+        if cost is None:
+            cost = size
+        if cost > self.max_size:
+            return
+        self._objs[key] = (obj, size, cost)
+        self.size += cost
+        while self.size > self.max_size:
+            k, (o, sz, c) = self._objs.popitem(last=False)
+            self.size -= c
+
+    def discard(self, key):
+        """
+        Forgets about given key, if present.
+        """
+        if key in self._objs:
+            self.size -= self._objs.pop(key)[2]
+
+    def clear(self):
+        self._objs.clear()
+        self.size = 0
+
+
 class DiskCache(object):
     """
     An helper class to handle on-disk caching of heavy files.
@@ -51,34 +512,122 @@ class DiskCache(object):
     * or an iterable of such types elements.
     In the later case, DiskCache will create a directory for each item
     but the last one (handy to organize/categorize things…).
+    Note that files and dirs starting with a dot are ignored, they are
+    reserved for the cache's own bookkeeping.
+
+    Cached objects are kept in least-recently-used order (persisted in the
+    cache index), when the cache grows over CCH_MAX_SIZE, oldest-used ones
+    are removed until its size is back under CCH_LOW_SIZE.
+
+    Several processes can safely share a same cache dir: objects are written
+    atomically, index updates are done under a cross-process lock, after
+    having reloaded the index if another process changed it. See also
+    get_or_build().
+    To keep writes cheap, objects set() are only saved in the on-disk index
+    when something is evicted, after builds, on flush() and at exit.
+
+    Recently used objects are also kept deserialized in memory (up to
+    CCH_MEM_MAX_SIZE), see the memory member.
+
+    Usage statistics are available through get_stats() (see also the stats
+    member).
     """
 
-    def __init__(self):
+    INDEX_NAME = ".files.index"
+    LOCK_NAME = ".lock"
+    KEYLOCKS_DIR = ".locks"
+    KEYLOCKS_STRIPES = 256
+    # Version of the index format, a mismatch means the index is discarded.
+    _version = 2
+
+    def __init__(self, path=None):
+        """
+        Inits the disk cache object, stored in path dir (CCH_DIR by default).
+        """
+        self.dir = path or CCH_DIR
+        self._reset()
+        self._index_sig = None
+        self._touched = set()
+        # Objects we wrote, not yet saved in the on-disk index:
+        # key -> (on-disk size, compression name).
+        self._pending = {}
+        self.memory = MemoryCache(CCH_MEM_MAX_SIZE)
+        self.stats = CacheStats()
+        self.index_path = os.path.join(self.dir, self.INDEX_NAME)
+        self._enabled = self._check_dir(self.dir)
+        self._lock = FileLock(os.path.join(self.dir, self.LOCK_NAME))
+        if self._enabled:
+            with self._lock:
+                if not self._sync():
+                    # No valid index, walk the cache tree.
+                    self._rebuild_index()
+                self.check_size()
+                self.flush()
+            atexit.register(self.flush)
+            # Child processes (e.g. workers) do not run atexit handlers.
+            self._finalizer = multiprocessing.util.Finalize(
+                                    self, self.flush, exitpriority=10)
+
+    def close(self):
+        """
+        Saves the index, and stops using that cache (e.g. before removing a
+        temporary one).
+        """
+        self.flush()
+        atexit.unregister(self.flush)
+        if getattr(self, "_finalizer", None):
+            self._finalizer.cancel()
+        self.memory.clear()
+        self._enabled = False
+
+    def _rebuild_index(self):
         """
-        Inits the disk cache object.
+        Rebuilds the in-memory index by walking the whole cache tree (only
+        needed when no valid on-disk index is available).
         """
-        self._cached = set()
+        sizes = {}
+        for dpath, dirs, fnames in os.walk(self.dir):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            root = self.path2key(dpath, self.dir)
+            self._cached.add(root)
+            for fn in fnames:
+                if not fn.startswith('.'):
+                    sizes[root + (fn,)] = \
+                        os.path.getsize(os.path.join(dpath, fn))
+        for key, size in sizes.items():
+            self._add_leaf(key, size)
+        self._dirty = True
+
+    def _reset(self):
+        """
+        Clears all in-memory bookkeeping.
+        """
+        self._cached = {()}
+        self._lru = collections.OrderedDict()  # leaf key -> on-disk size.
+        self._nleaves = {(): 0}  # (partial) key -> number of leaves under it.
+        self._compressed = {}  # leaf key -> compression name.
         self._size = 0
-        if os.path.exists(CCH_DIR):
-            if os.path.isdir(CCH_DIR):
-                for dpath, dirs, fnames in os.walk(CCH_DIR):
-                    root = self.path2key(dpath)
-                    self._cached.add(root)
-                    self._cached |= {root + (fn,) for fn in fnames}
-                    it = (os.path.getsize(os.path.join(dpath, fn))
-                          for fn in fnames)
-                    self._size += functools.reduce(lambda a, b: a + b, it, 0)
-            else:
+        self._dirty = False
+
+    @staticmethod
+    def _check_dir(path):
+        """
+        Ensures the cache dir exists, returns False if it cannot be used.
+        """
+        if os.path.exists(path):
+            if not os.path.isdir(path):
                 print("ERROR: Can’t use disk cache, its dir path is already "
-                      "a file ({})!".format(CCH_DIR))
+                      "a file ({})!".format(path))
+                return False
         else:
-            os.mkdir(CCH_DIR)
-        self.check_size()
+            os.makedirs(path, exist_ok=True)
+        return True
 
     def __iter__(self):
         """
         Iterates over all cached keys (dir [categories] included).
         """
+        self._sync()
         return iter(self._cached)
 
     def __contains__(self, key):
@@ -86,8 +635,13 @@ class DiskCache(object):
         Checks whether that cache object knows a given key.
         In case of giving a partial key (i.e. only some first elements),
         returns true if dir exists.
+        Changes made by other processes are only looked for on misses (so
+        that hits never touch the filesystem).
         """
-        return self.norm_key(key) in self._cached
+        key = self.norm_key(key)
+        if key not in self._cached:
+            self._sync()
+        return key in self._cached
 
     def __getitem__(self, key):
         """
@@ -97,26 +651,53 @@ class DiskCache(object):
         """
         key = self.norm_key(key)
         if key not in self._cached:
+            self._sync()
+            if key not in self._cached:
+                self.stats.misses += 1
+                raise KeyError()
+        if key in self._lru:
+            return self._get_leaf(key)
+        ret = {key: {}}
+        for k in tuple(self._leaves(key)):
+            r = ret[key]
+            for _k in k[len(key):-1]:
+                if _k not in r:
+                    r[_k] = {}
+                r = r[_k]
+            r[k[-1]] = self._get_leaf(k)
+        return ret
+
+    def _get_leaf(self, key):
+        """
+        Reads a cached object, and marks it as most recently used.
+        """
+        self._touch(key)
+        try:
+            data = self.memory.get(key, self._lru[key])
+            self.stats.hits += 1
+            return data
+        except KeyError:
+            pass
+        try:
+            t = time.perf_counter()
+            codec_t = self.stats.time_read_codec
+            data, raw_size = self._read(key)
+            self.stats.time_read_io += time.perf_counter() - t - \
+                                       (self.stats.time_read_codec - codec_t)
+            self.stats.reads += 1
+            self.stats.hits += 1
+            self.memory.put(key, data, self._lru[key],
+                            estimate_size(data, raw_size))
+            return data
+        except (FileNotFoundError, CorruptedDataError):
+            self.stats.misses += 1
+            # Removed (or damaged) behind our back…
+            with self._lock:
+                self._sync()
+                if key in self._lru:
+                    self._remove_leaf(key)
+                self.flush()
             raise KeyError()
-        path = self.key2path(key)
-        if os.path.isdir(path):
-            ret = {key: {}}
-            for dpath, dirs, fnames in os.walk(path):
-                for fn in fnames:
-                    p = os.path.join(dpath, fn)
-                    k = self.path2key(p, path)
-                    if key + k not in self._cached:
-                        continue
-                    r = ret[key]
-                    for _k in k[:-1]:
-                        if _k not in r:
-                            r[_k] = {}
-                        r = r[_k]
-                    with open(p, "rb") as f:
-                        r[k[-1]] = pickle.load(f)
-        else:
-            with open(path, "rb") as f:
-                return pickle.load(f)
 
     def __setitem__(self, key, data):
         """
@@ -124,83 +705,412 @@ class DiskCache(object):
         In case of giving a partial key (i.e. only some first elements),
         raises an error.
         """
+        self.set(key, data)
+
+    def set(self, key, data, codec=None, compression=None):
+        """
+        Stores an object into cache, using given codec (name, see CODECS),
+        or an automatically chosen one, and given compression (see encode()).
+        In case of giving a partial key (i.e. only some first elements),
+        raises an error.
+        """
         key = self.norm_key(key)
-        path = self.key2path(key)
-        oldsize = 0
-        if key in self._cached and os.path.isdir(path):
-            raise KeyError()
-        elif os.path.isfile(path):
-            oldsize = os.path.getsize(path)
-        else:
-            dirp = os.path.dirname(path)
-            if not os.path.exists(dirp):
-                os.makedirs(dirp)
-        with open(path, "wb") as f:
-            pickle.dump(data, f)
-        self._cached.add(key)
-        key = key[:-1]
-        while key not in self._cached:
-            self._cached.add(key)
-            key = key[:-1]
-        self._size += os.path.getsize(path) - oldsize
-        self.check_size()
+        t = time.perf_counter()
+        chunks = encode(data, codec, compression)
+        compression = get_compression(chunks[0])
+        raw_size = get_raw_size(chunks)
+        self.stats.time_write_codec += time.perf_counter() - t
+        with self._lock:
+            self._sync()
+            if key in self._cached and key not in self._lru:
+                raise KeyError()
+            t = time.perf_counter()
+            size = self._write(key, chunks)
+            self.stats.time_write_io += time.perf_counter() - t
+            self.stats.writes += 1
+            self.stats.bytes_written += size
+            self._add_leaf(key, size)
+            self._pending[key] = (size, compression)
+            if compression:
+                self._compressed[key] = compression
+            else:
+                self._compressed.pop(key, None)
+            self.memory.put(key, data, self._lru[key],
+                            estimate_size(data, raw_size))
+            self.check_size()
+
+    def get_or_build(self, key, builder, codec=None, compression=None):
+        """
+        Returns the object cached under key, or, if missing, builds it by
+        calling builder() (without argument), caches and returns it.
+        When CCH_SINGLE_FLIGHT setting is enabled, only one process at a time
+        can build a given key, others wait for it and then simply read the
+        newly cached object.
+        """
+        key = self.norm_key(key)
+        try:
+            if key in self:
+                return self[key]
+        except KeyError:
+            pass
+        if not (CCH_SINGLE_FLIGHT and self._enabled):
+            return self._build(key, builder, codec, compression)
+        with self._key_lock(key):
+            try:
+                if key in self:
+                    return self[key]
+            except KeyError:
+                pass
+            return self._build(key, builder, codec, compression)
+
+    def _build(self, key, builder, codec, compression):
+        """
+        Builds and caches a missing object.
+        """
+        self.stats.misses += 1
+        self.stats.builds += 1
+        t = time.perf_counter()
+        data = builder()
+        self.stats.time_build += time.perf_counter() - t
+        self.set(key, data, codec, compression)
+        # Building is costly anyway, save the index right away, so that
+        # other processes (e.g. waiting for it, or our parent if we are a
+        # worker) see it.
+        self.flush()
+        return data
+
+    def _key_lock(self, key):
+        """
+        Returns a lock dedicated to given (normalized) key.
+        Keys share a fixed pool of KEYLOCKS_STRIPES lock files (chosen by
+        their hash), so that lock files never pile up (and never have to be
+        removed while someone may be waiting on them).
+        """
+        dirp = os.path.join(self.dir, self.KEYLOCKS_DIR)
+        os.makedirs(dirp, exist_ok=True)
+        h = hashlib.sha1("/".join(key).encode("utf-8")).digest()
+        name = "{:x}".format(int.from_bytes(h[:4], "little") %
+                             self.KEYLOCKS_STRIPES)
+        return FileLock(os.path.join(dirp, name))
+
+    def clear(self):
+        """
+        Removes all cached objects (and key locks).
+        """
+        with self._lock:
+            self._sync()
+            for key in tuple(self._lru):
+                self._remove_leaf(key)
+            self.memory.clear()
+            self.flush()
+            shutil.rmtree(os.path.join(self.dir, self.KEYLOCKS_DIR),
+                          ignore_errors=True)
 
     def __delitem__(self, key):
         """
-        Stores an object into cache.
+        Removes an object from cache.
         In case of giving a partial key (i.e. only some first elements),
         deletes the whole tree under given key.
         """
         key = self.norm_key(key)
-        if key not in self._cached:
-            raise KeyError()
-        path = self.key2path(key)
-        if os.path.isdir(path):
-            for k in (k for k in self._cached if self.issub(k, key)):
-                p = self.key2path(k)
-                if os.path.isfile(p):
-                    self._cached.remove(k)
-                    self._size -= os.path.getsize(p)
-            shutil.rmtree(path)
-        elif os.path.isfile(path):
-            self._cached.remove(key)
-            self._size -= os.path.getsize(path)
-            os.remove(path)
+        with self._lock:
+            self._sync()
+            if key not in self._cached:
+                raise KeyError()
+            if key in self._lru:
+                self._remove_leaf(key)
+            else:
+                for k in tuple(self._leaves(key)):
+                    self._remove_leaf(k)
+                # Also forget about empty categories.
+                self._cached -= {k for k in self._cached
+                                 if k and self.issub(k, key)}
+                self._unlink_tree(key)
+            self.flush()
+
+    # -------------------------------------------------------------------------
+    # LRU bookkeeping.
+
+    def _touch(self, key):
+        """
+        Marks a cached object as the most recently used one.
+        """
+        self._lru.move_to_end(key)
+        self._touched.add(key)
+        self._dirty = True
+
+    def _add_leaf(self, key, size):
+        """
+        Registers a (new or updated) cached object of given on-disk size,
+        as the most recently used one.
+        """
+        if key in self._lru:
+            self._size -= self._lru[key]
+        else:
+            for i in range(len(key)):
+                p = key[:i]
+                self._nleaves[p] = self._nleaves.get(p, 0) + 1
+                self._cached.add(p)
+            self._cached.add(key)
+        self._lru[key] = size
+        self._size += size
+        self._touch(key)
+
+    def _remove_leaf(self, key):
+        """
+        Removes a cached object, and the categories it leaves empty.
+        """
+        self._unlink(key)
+        self.memory.discard(key)
+        self._compressed.pop(key, None)
+        self._size -= self._lru.pop(key)
+        self._cached.discard(key)
+        self._touched.discard(key)
+        self._nleaves[()] -= 1
+        for i in range(len(key) - 1, 0, -1):
+            p = key[:i]
+            self._nleaves[p] -= 1
+            if not self._nleaves[p]:
+                del self._nleaves[p]
+                self._cached.discard(p)
+                self._unlink_dir(p)
+        self._dirty = True
+
+    def _leaves(self, root):
+        """
+        Yields all cached objects' keys under root key.
+        """
+        return (k for k in self._lru if self.issub(k, root))
 
     def check_size(self):
         """
         Checks actual cache size is not over allowed limit, and removes
-        oldest-used cached elements if needed.
-        """
-        if self._size > CCH_MAX_SIZE:
-            files = []
-            for el in self._cached:
-                fn = os.path.join(CCH_DIR, *el)
-                if os.path.isfile(fn):
-                    stat = os.stat(fn)
-                    files.append((el, fn, stat.st_atime, stat.st_size))
-            files.sort(key=lambda x: x[2])
-            print("WARNING! Cache too big ({} Mo), removing some files…".format(self._size / 1024 / 1024))
-            for el, fn, atime, size in files:
-                if utils.DEBUG:
-                    print("    Removing {} (key: {}).".format(fn, str(el)))
-                os.remove(fn)
-                self._cached.remove(el)
-                self._size -= size
-                el = el[:-1]
-                while el:
-                    path = self.key2path(el)
-                    if os.listdir(path):  # Not empty!
-                        break
+        least-recently-used cached elements if needed, until size is back
+        under the low-water mark.
+        Each removal is O(1), no stat of cached files is needed. The index
+        is only saved when something was removed (else, new objects are
+        saved in it by next flush(), at the latest when the process exits).
+        """
+        with self._lock:
+            evicted = False
+            if self._size > CCH_MAX_SIZE:
+                print("WARNING! Cache too big ({} Mo), removing some "
+                      "entries…".format(self._size / 1024 / 1024))
+                while self._lru and self._size > CCH_LOW_SIZE:
+                    el = next(iter(self._lru))
                     if utils.DEBUG:
-                        print("    Removing empty {} (key: {}).".format(path, str(el)))
-                    os.rmdir(path)
-                    self._cached.remove(el)
-                    el = el[:-1]
-                if self._size <= CCH_MAX_SIZE:
-                    break
-        if self._size < 0:
-            self._size = 0
+                        print("    Removing key {}.".format(str(el)))
+                    self._remove_leaf(el)
+                    self.stats.evictions += 1
+                evicted = True
+            if self._size < 0:
+                self._size = 0
+            if evicted:
+                self.flush()
+
+    # -------------------------------------------------------------------------
+    # Statistics.
+
+    def get_stats(self):
+        """
+        Returns a (JSON-serializable) dict of statistics about this cache:
+        its current state (sizes, entries per key prefix, in-memory part),
+        and the counters of its stats member.
+        """
+        prefixes = {}
+        for key, size in self._lru.items():
+            p = key[0] if len(key) > 1 else ""
+            if p not in prefixes:
+                prefixes[p] = {"entries": 0, "size": 0, "compressed": 0}
+            prefixes[p]["entries"] += 1
+            prefixes[p]["size"] += size
+            if key in self._compressed:
+                prefixes[p]["compressed"] += 1
+        ret = {"backend": type(self).__name__, "dir": self.dir,
+               "size": self._size, "max_size": CCH_MAX_SIZE,
+               "low_size": CCH_LOW_SIZE, "entries": len(self._lru),
+               "prefixes": prefixes,
+               "memory": {"size": self.memory.size,
+                          "max_size": self.memory.max_size,
+                          "entries": len(self.memory),
+                          "hits": self.memory.hits,
+                          "misses": self.memory.misses}}
+        ret.update(self.stats.to_dict())
+        return ret
+
+    def dump_stats(self, f=None):
+        """
+        Writes statistics as JSON into given text file (stderr by default).
+        """
+        json.dump(self.get_stats(), f or sys.stderr, indent=4, sort_keys=True)
+        print(file=f or sys.stderr)
+
+    # -------------------------------------------------------------------------
+    # Index persistence.
+
+    def _get_index_sig(self):
+        """
+        Returns a signature of the on-disk index file (changes each time it
+        is rewritten), or None if it does not exist.
+        """
+        try:
+            st = os.stat(self.index_path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _sync(self):
+        """
+        Reloads the on-disk index if it was changed (by another process) since
+        we last read or wrote it.
+        Our own objects' usages not yet saved are kept.
+        Always done under the cross-process lock, so that we never see the
+        index (and data) while another process is updating them.
+        Returns False if no valid on-disk index is available.
+        """
+        if not self._enabled:
+            return True
+        with self._lock:
+            sig = self._get_index_sig()
+            if sig is None:
+                return False
+            if sig == self._index_sig:
+                return True
+            idx = self._read_index()
+            if not idx:
+                return False
+            self._reset()
+            self._load_index(idx)
+            # Our own writes not yet saved must not be lost.
+            for key, (size, compression) in self._pending.items():
+                self._add_leaf(key, size)
+                if compression:
+                    self._compressed[key] = compression
+                self._dirty = True
+            for key in self._touched:
+                if key in self._lru:
+                    self._lru.move_to_end(key)
+                    self._dirty = True
+            self._index_sig = self._get_index_sig()
+            return True
+
+    def _read_index(self):
+        """
+        Returns content of the on-disk index, or None if not available/valid.
+        """
+        try:
+            with open(self.index_path, "rb") as f:
+                idx = pickle.load(f)
+        except Exception:
+            return None
+        if idx.get("version") != self._version:
+            return None
+        return idx
+
+    def _load_index(self, idx):
+        """
+        Loads in-memory bookkeeping from (valid) on-disk index content.
+        """
+        for key, size in idx["lru"].items():
+            self._add_leaf(key, size)
+        self._compressed = dict(idx["compressed"])
+        self._dirty = False
+
+    def _index_data(self):
+        """
+        Returns the dict to be saved as on-disk index.
+        """
+        return {"version": self._version, "lru": self._lru,
+                "compressed": self._compressed}
+
+    def flush(self):
+        """
+        Writes the index back to disk, if needed.
+        """
+        if not self._enabled:
+            return
+        with self._lock:
+            self._sync()
+            if not self._dirty:
+                return
+            self._atomic_write(self.index_path,
+                               (pickle.dumps(self._index_data(),
+                                             pickle.HIGHEST_PROTOCOL),))
+            self._index_sig = self._get_index_sig()
+            self._touched.clear()
+            self._pending.clear()
+            self._dirty = False
+
+    @staticmethod
+    def _atomic_write(path, chunks):
+        """
+        Writes chunks into path, through a temp file then renamed, so that
+        readers never see a partially written file.
+        Returns the written size.
+        """
+        dirp, name = os.path.split(path)
+        tmp = os.path.join(dirp, ".{}.{}.tmp".format(name, os.getpid()))
+        with open(tmp, "wb") as f:
+            f.writelines(chunks)
+            size = f.tell()
+        os.replace(tmp, path)
+        return size
+
+    # -------------------------------------------------------------------------
+    # Storage primitives, the only part that depends on how data is actually
+    # stored on disk (keys given here are always normalized ones).
+
+    def _read(self, key):
+        """
+        Loads a cached object, returns it with its uncompressed size.
+        """
+        with open(self.key2path(key, self.dir), "rb") as f:
+            return self._decode(f.read())
+
+    def _decode(self, buf):
+        """
+        Deserializes a cached object's data, accounting it in stats.
+        Returns the object and its uncompressed size.
+        """
+        t = time.perf_counter()
+        data = decode(buf)
+        self.stats.time_read_codec += time.perf_counter() - t
+        self.stats.bytes_read += len(buf)
+        return data, get_raw_size((buf,))
+
+    def _write(self, key, chunks):
+        """
+        Saves an (encoded) object, returns its on-disk size.
+        """
+        path = self.key2path(key, self.dir)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return self._atomic_write(path, chunks)
+
+    def _unlink(self, key):
+        """
+        Removes a cached object from disk.
+        """
+        path = self.key2path(key, self.dir)
+        if os.path.isfile(path):
+            os.remove(path)
+
+    def _unlink_dir(self, key):
+        """
+        Removes an (empty) category from disk.
+        """
+        path = self.key2path(key, self.dir)
+        if os.path.isdir(path) and not os.listdir(path):
+            if utils.DEBUG:
+                print("    Removing empty {} (key: {}).".format(path, str(key)))
+            os.rmdir(path)
+
+    def _unlink_tree(self, key):
+        """
+        Removes what remains of a (now empty) category from disk.
+        """
+        path = self.key2path(key, self.dir)
+        if key and os.path.isdir(path):
+            shutil.rmtree(path)
 
     @staticmethod
     def norm_key(key):
@@ -250,15 +1160,20 @@ class DiskCache(object):
         return h
 
     @staticmethod
-    def hashiostream(rs, salt):
+    def hashiostream(rs, salt, tee=None):
         """
         Returns an hashlib’s hash object fed with salt bytes, and the whole
         content of rs binary iostream.
+        If tee is not None, it must be a list, to which all read chunks are
+        appended (so that the stream does not have to be read twice when
+        its content is also needed).
         """
         h = hashlib.new(HASH_TYPE, salt)
         chunk = rs.read(HASH_READ_CHUNK)
         while chunk:
             h.update(chunk)
+            if tee is not None:
+                tee.append(chunk)
             chunk = rs.read(HASH_READ_CHUNK)
         return h
 
@@ -269,7 +1184,271 @@ class DiskCache(object):
         content of path file (binary-read).
         """
         with open(path, "rb") as f:
-            return Hunspell.hashiostream(f, salt)
+            return DiskCache.hashiostream(f, salt)
+
+
+class MMapDiskCache(DiskCache):
+    """
+    A DiskCache storing all cached objects in a single append-only data file,
+    memory-mapped for reading, with a compact index file mapping each key to
+    its offset and length in the data file (in least-recently-used order).
+    Opening it only means reading the index, there is no walk nor stat over
+    the whole cache tree, and reads never touch the filesystem metadata.
+    Keys behave exactly as with DiskCache (hierarchical, partial keys…).
+    """
+
+    DATA_NAME = ".mmap.data"
+    INDEX_NAME = ".mmap.index"
+    _version = 3
+    # The data file is compacted when it holds more dead bytes than this
+    # (and more dead than live ones).
+    _compact_min = 4 * 1024 * 1024
+
+    def __init__(self, path=None):
+        """
+        Inits the disk cache object, loading its index.
+        """
+        self._offsets = {}
+        self._dead = 0
+        self._map = None
+        self.data_path = os.path.join(path or CCH_DIR, self.DATA_NAME)
+        super(MMapDiskCache, self).__init__(path)
+
+    def _rebuild_index(self):
+        # Nothing we can rebuild from, start from an empty data file.
+        self._atomic_write(self.data_path, ())
+        self._unmap()
+        self._offsets = {}
+        self._dead = 0
+        self._dirty = True
+
+    def _data_matches(self, idx):
+        """
+        Whether the data file holds (at least) all data given index refers
+        to.
+        """
+        return os.path.isfile(self.data_path) and \
+               self._data_size() >= idx["data_size"]
 
+    def _load_index(self, idx):
+        # Always called under lock (see _sync()).
+        if not self._data_matches(idx):
+            # Make sure the index was not updated in between, before
+            # deciding that data is lost.
+            idx = self._read_index()
+            if not idx or not self._data_matches(idx):
+                # Data file does not match the index!
+                self._rebuild_index()
+                return
+        super(MMapDiskCache, self)._load_index(idx)
+        if self._offsets != idx["offsets"]:
+            # Another process changed the data file, make sure we are not
+            # reading from an outdated (e.g. compacted) one.
+            self._unmap()
+        self._offsets = idx["offsets"]
+        self._dead = idx["dead"]
 
-cache = DiskCache()
+    def _index_data(self):
+        idx = super(MMapDiskCache, self)._index_data()
+        idx.update({"offsets": self._offsets, "dead": self._dead,
+                    "data_size": self._data_size()})
+        return idx
+
+    def _data_size(self):
+        """
+        Returns the size of the data file (live and dead bytes).
+        """
+        return os.path.getsize(self.data_path)
+
+    def _mmap(self, end):
+        """
+        Returns a read-only memory map of the data file, covering at least
+        end bytes (re-mapping it if it has grown since last call).
+        """
+        if self._map is None or len(self._map) < end:
+            self._unmap()
+            with open(self.data_path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def _unmap(self):
+        """
+        Closes current memory map of the data file, if any.
+        """
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # Some loaded objects still use (out-of-band) buffers from
+                # that map, it will be closed once they are released.
+                pass
+            self._map = None
+
+    def _read(self, key):
+        # Our map, if any, always matches our offsets (it is dropped each
+        # time they are reloaded, and the data file is only ever appended
+        # to, or atomically replaced), so it can be read without lock (at
+        # worst getting an object removed by another process since then).
+        mm = self._map
+        if mm is not None and key in self._offsets:
+            offset, length = self._offsets[key], self._lru[key]
+            if len(mm) >= offset + length:
+                with memoryview(mm) as mv, \
+                     mv[offset:offset + length] as data:
+                    return self._decode(data)
+        # Else, make sure our offsets are still valid, and the data file is
+        # not compacted while we map it.
+        with self._lock:
+            self._sync()
+            if key not in self._lru:
+                raise FileNotFoundError()
+            offset, length = self._offsets[key], self._lru[key]
+            try:
+                mm = self._mmap(offset + length)
+            except ValueError:  # Empty data file…
+                raise FileNotFoundError()
+            if len(mm) < offset + length:  # Truncated data file…
+                raise FileNotFoundError()
+        with memoryview(mm) as mv, mv[offset:offset + length] as data:
+            return self._decode(data)
+
+    def _write(self, key, chunks):
+        # Always called under lock, so no-one else is appending.
+        if key in self._lru:
+            self._dead += self._lru[key]
+        with open(self.data_path, "ab") as f:
+            offset = f.tell()
+            f.writelines(chunks)
+            size = f.tell() - offset
+        self._offsets[key] = offset
+        self._dirty = True
+        return size
+
+    def _unlink(self, key):
+        self._dead += self._lru[key]
+        del self._offsets[key]
+
+    def _unlink_dir(self, key):
+        pass
+
+    def _unlink_tree(self, key):
+        pass
+
+    def compact(self):
+        """
+        Rewrites the data file with only live entries, dropping dead bytes
+        left behind by removed or overwritten ones.
+        """
+        with self._lock:
+            self._sync()
+            offsets = {}
+            dirp, name = os.path.split(self.data_path)
+            tmp = os.path.join(dirp, ".{}.{}.tmp".format(name, os.getpid()))
+            with open(tmp, "wb") as f:
+                for key, offset in sorted(self._offsets.items(),
+                                          key=lambda i: i[1]):
+                    length = self._lru[key]
+                    mm = self._mmap(offset + length)
+                    offsets[key] = f.tell()
+                    f.write(mm[offset:offset + length])
+            self._unmap()
+            os.replace(tmp, self.data_path)
+            self._offsets = offsets
+            self._dead = 0
+            self._dirty = True
+            self.flush()
+
+    def check_size(self):
+        """
+        Checks actual cache size is not over allowed limit, and removes
+        least-recently-used cached elements if needed.
+        Also compacts the data file when it holds too much dead data, and
+        saves the index.
+        """
+        with self._lock:
+            if self._enabled and \
+               self._dead > max(self._compact_min, self._size):
+                self.compact()
+            super(MMapDiskCache, self).check_size()
+            # Our appended data is only safe once in the index (another
+            # process compacting the data file would drop it, else).
+            self.flush()
+
+
+class LazyDiskCache(object):
+    """
+    A thin proxy around the DiskCache (or MMapDiskCache, depending on
+    CCH_BACKEND setting) singleton, only creating it on first real use.
+    This way, importing that module costs nearly nothing, tools that never
+    use the cache never pay for opening it.
+    Static helpers (hashes, keys conversions…) never create the cache.
+    """
+
+    def __init__(self):
+        self._cache = None
+
+    def _get_class(self):
+        if CCH_BACKEND == "mmap":
+            return MMapDiskCache
+        return DiskCache
+
+    def get(self):
+        """
+        Returns the real cache object, creating it if needed.
+        """
+        if self._cache is None:
+            self._cache = self._get_class()()
+        return self._cache
+
+    def is_loaded(self):
+        """
+        Returns True if the real cache object has already been created.
+        """
+        return self._cache is not None
+
+    def swap(self, real):
+        """
+        Makes that proxy use given real cache object (or None to get back to
+        a lazily created default one), returns the previous one (or None).
+        """
+        prev, self._cache = self._cache, real
+        return prev
+
+    def __getattr__(self, name):
+        cls = self._get_class()
+        for c in cls.__mro__:
+            if isinstance(c.__dict__.get(name), staticmethod):
+                return getattr(cls, name)
+        return getattr(self.get(), name)
+
+    def __iter__(self):
+        return iter(self.get())
+
+    def __contains__(self, key):
+        return key in self.get()
+
+    def __getitem__(self, key):
+        return self.get()[key]
+
+    def __setitem__(self, key, data):
+        self.get()[key] = data
+
+    def __delitem__(self, key):
+        del self.get()[key]
+
+
+cache = LazyDiskCache()
+
+
+def dump_stats_at_exit(f=None):
+    """
+    Makes the cache singleton write its statistics (as JSON) into given
+    text file (stderr by default) when the process exits (only if it has
+    been used).
+    """
+    def _dump():
+        if cache.is_loaded():
+            cache.dump_stats(f)
+        else:
+            print('{"loaded": false}', file=f or sys.stderr)
+    atexit.register(_dump)
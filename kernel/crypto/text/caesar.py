@@ -41,8 +41,10 @@ if __name__ == '__main__':
                                                  "..", "..", "..")))
 
 import kernel.utils as utils
+import kernel.cache as cache
 import kernel.hunspell as hunspell
-import kernel.matchdic as matchdic
+import kernel.dicbundle as dicbundle
+import kernel.ngrams as ngrams
 
 __version__ = "0.5.0"
 __date__ = "2012/02/26"
@@ -353,10 +355,8 @@ def do_hack(text, algos=None, methods=None, keys=None):
     """
     Brute-force hacking of caesar-cyphered text...
     """
-    h = hunspell.Hunspell()
-    h.load_dic_zip(hunspell.ZIP_DICS)
-    m = matchdic.MatchDic(h)
-    m.init(charset=DIC_CHARSET, charmap=DIC_CHARMAP, minlen=3)
+    m = dicbundle.load_matchdic(charset=DIC_CHARSET, charmap=DIC_CHARMAP,
+                               minlen=3)
 
     def _gen(text, algos, methods, keys):
         if algos:
@@ -403,19 +403,20 @@ def do_hack(text, algos=None, methods=None, keys=None):
                            do_decypher_square(text, k, SQUARE_CONSTHIGH))
     generator = _gen(text, algos, methods, keys)
 
-    # Make three probes in results...
-    slice_len = 50
-    slice_nbr = max(1, min(3, (len(text) + slice_len - 1) // slice_len))
-    slice_step = max((len(text) - slice_len) // slice_nbr, 1)
-    for algo, method, key, res in generator:
-        # The first probe determines the language!
-        maxmatch = m.find_best_dic(res[:slice_len])
-        lng = max(maxmatch, key=lambda k: maxmatch[k])
-        avg = maxmatch[lng]
-        for i in range(slice_step, slice_nbr * slice_step, slice_step):
-            avg += m.get_match_level(lng, res[i:i + slice_len])
-        avg /= slice_nbr
+    cands = list(generator)
+    # Only check most promising candidates against dics.
+    keep, rejected = ngrams.prefilter(m, [c[-1] for c in cands])
+    kept = [cands[i] for i in keep]
+    # Make three probes in results (the first one determines the language),
+    # all candidates being scored at once.
+    scores = m.probe_many((res for algo, method, key, res in kept),
+                          slice_len=50, slice_nbr=3, ref_len=len(text))
+    for (algo, method, key, res), (lng, avg) in zip(kept, scores):
         yield (algo, method, key, res, lng, avg)
+    # Rejected candidates are still given (after scored ones, from the most
+    # promising one), with a null match value.
+    for i, lng in rejected:
+        yield cands[i] + (lng, 0.0)
 
 
 def decypher(text, algos, methods, keys):
@@ -482,6 +483,9 @@ def main():
                                      "code.")
     parser.add_argument('--debug', action="store_true", default=False,
                         help="Enable debug mode.")
+    parser.add_argument('--cache-stats', action="store_true", default=False,
+                        help="Print disk cache statistics (as JSON) on "
+                             "stderr at exit.")
 
     sparsers = parser.add_subparsers(dest="command")
 
@@ -540,6 +544,8 @@ def main():
 
     args = parser.parse_args()
     utils.DEBUG = args.debug
+    if args.cache_stats:
+        cache.dump_stats_at_exit()
 
     if args.command == "cypher":
         try:
@@ -40,8 +40,9 @@ if __name__ == '__main__':
                                                  "..", "..", "..")))
 
 import kernel.utils as utils
-import kernel.hunspell as hunspell
-import kernel.matchdic as matchdic
+import kernel.cache as cache
+import kernel.dicbundle as dicbundle
+import kernel.ngrams as ngrams
 
 __version__ = "0.1.0"
 __date__ = "2012/04/27"
@@ -189,11 +190,10 @@ def do_hack(text, codecs=None, lengths=None):
     """
     Brute-force hacking of Gray-cyphered text...
     """
-    h = hunspell.Hunspell()
-    h.load_dic_zip(hunspell.ZIP_DICS)
-    m = matchdic.MatchDic(h)
-#    m.init(charset=DIC_CHARSET, charmap=DIC_CHARMAP, minlen=3)
-    m.init(charset=None, charmap=None, func=str.lower, minlen=3)
+#    m = dicbundle.load_matchdic(charset=DIC_CHARSET, charmap=DIC_CHARMAP,
+#                                minlen=3)
+    m = dicbundle.load_matchdic(charset=None, charmap=None, func=str.lower,
+                                minlen=3)
 
     def _gen(text, codecs, lengths):
         if codecs:
@@ -212,19 +212,20 @@ def do_hack(text, codecs=None, lengths=None):
                     pass
     generator = _gen(text, codecs, lengths)
 
-    slice_len = 50
-    for codec, length, res in generator:
-        # Make at most three probes in results...
-        slice_nbr = max(1, min(3, (len(res) + slice_len - 1) // slice_len))
-        slice_step = max((len(res) - slice_len) // slice_nbr, 1)
-        # The first probe determines the language!
-        maxmatch = m.find_best_dic(res[:slice_len])
-        lng = max(maxmatch, key=lambda k: maxmatch[k])
-        avg = maxmatch[lng]
-        for i in range(slice_step, slice_nbr * slice_step, slice_step):
-            avg += m.get_match_level(lng, res[i:i + slice_len])
-        avg /= slice_nbr
+    cands = list(generator)
+    # Only check most promising candidates against dics.
+    keep, rejected = ngrams.prefilter(m, [c[-1] for c in cands])
+    kept = [cands[i] for i in keep]
+    # Make at most three probes in results (the first one determines the
+    # language), all candidates being scored at once.
+    scores = m.probe_many((res for codec, length, res in kept),
+                          slice_len=50, slice_nbr=3)
+    for (codec, length, res), (lng, avg) in zip(kept, scores):
         yield (codec, length, res, lng, avg)
+    # Rejected candidates are still given (after scored ones, from the most
+    # promising one), with a null match value.
+    for i, lng in rejected:
+        yield cands[i] + (lng, 0.0)
 
 
 def decypher(text, codecs=DEFAULT, lengths=8):
@@ -264,6 +265,9 @@ def main():
                                                  "in Gray code.")
     parser.add_argument('--debug', action="store_true", default=False,
                         help="Enable debug mode.")
+    parser.add_argument('--cache-stats', action="store_true", default=False,
+                        help="Print disk cache statistics (as JSON) on "
+                             "stderr at exit.")
 
     sparsers = parser.add_subparsers(dest="command")
 
@@ -297,6 +301,8 @@ def main():
 
     args = parser.parse_args()
     utils.DEBUG = args.debug
+    if args.cache_stats:
+        cache.dump_stats_at_exit()
 
     if args.command == "cypher":
         try:
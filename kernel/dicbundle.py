@@ -0,0 +1,385 @@
+########################################################################
+#                                                                      #
+#   Cyprium is a multifunction cryptographic, steganographic and       #
+#   cryptanalysis tool developped by members of The Hackademy.         #
+#   French White Hat Hackers Community!                                #
+#   cyprium.hackademics.fr                                             #                                                  #
+#   Authors: SAKAROV, mont29, afranck64                                #
+#   Contact: admin@hackademics.fr                                      #
+#   Forum: hackademics.fr                                              #
+#   Twitter: @hackademics_                                             #
+#                                                                      #
+#   Cyprium is free software: you can redistribute it and/or modify    #
+#   it under the terms of the GNU General Public License as published  #
+#   by the Free Software Foundation, either version 3 of the License,  #
+#   or any later version.                                              #
+#                                                                      #
+#   This program is distributed in the hope that it will be useful,    #
+#   but without any warranty; without even the implied warranty of     #
+#   merchantability or fitness for a particular purpose. See the       #
+#   GNU General Public License for more details.                       #
+#                                                                      #
+#   The terms of the GNU General Public License is detailed in the     #
+#   COPYING attached file. If not, see : http://www.gnu.org/licenses   #
+#                                                                      #
+########################################################################
+
+
+import sys
+import os
+import array
+import itertools
+import struct
+import json
+import mmap
+
+import settings
+import kernel.cache as cache
+import kernel.utils as utils
+import kernel.hunspell as hunspell
+import kernel.matchdic as matchdic
+
+__about__ = """
+Expanding Hunspell dics and pre-processing their words for MatchDic takes
+a few tens of seconds (or a few seconds, with cache), at each start.
+
+A dics bundle is a single binary file, built once from kernel/dics.zip,
+storing the final (expanded and pre-processed) lists of words of each dic,
+already bucketed by length, for a few pre-processing profiles. It is
+memory-mapped at load time, and MatchDic gets its words from it without even
+opening Hunspell dics.
+
+Buckets are stored in SortedWords layout: with the "sorted" words index (see
+DICS_WORDS_INDEX setting), MatchDic looks up its words directly in the
+mapped bundle, without any per-word work at load time. With the default
+"sets" one, words still have to be decoded into sets of str (which is much
+quicker than expanding Hunspell dics, though).
+
+A bundle is only used if it matches current content of dics.zip (and current
+version of the parsing code), else we silently fall back to usual Hunspell
+processing.
+"""
+
+
+BUNDLE_PATH = settings.DICS_BUNDLE
+USE_BUNDLE = settings.DICS_USE_BUNDLE
+ZIP_DICS = hunspell.ZIP_DICS
+JOBS = settings.DICS_JOBS
+USER_DICS = settings.DICS_USER
+
+# Pre-processing profiles stored by default in a bundle (those used by the
+# hackers). Profiles are identified in bundle by MatchDic params hash, so
+# these names are only used by build command.
+PROFILES = {
+    "upper_ascii": {"charset": utils.WE2UASCII_CHARSET,
+                    "charmap": utils.WE2UASCII_CHARMAP, "minlen": 3},
+    "lower": {"func": str.lower, "minlen": 3},
+}
+
+# File format: header, then JSON table of content, then raw data.
+# Each length bucket is a SortedWords ranges array (native byte order, as
+# given in toc), followed by its buffer of sorted, utf-8 encoded words,
+# NULL-padded to the bucket's width (always with at least one NULL, so that
+# the buffer can also be split as a NULL-separated block).
+MAGIC = b"CyDB"
+VERSION = 3
+HEADER = struct.Struct("<4sHHQ")  # magic, version, reserved, toc size.
+RANGES_SIZE = 257 * array.array("I").itemsize
+
+
+def get_fingerprints(zip_path=ZIP_DICS):
+    """
+    Returns a dict {uid: fingerprint} of all dics in given zip archive.
+    Fingerprints only depend on aff/dic members' CRC and size (and on
+    version of parsing code), so they are cheap to get (no decompression),
+    and stable across checkouts.
+    """
+    import zipfile
+    ret = {}
+    with zipfile.ZipFile(zip_path) as zip_arch:
+        files = set(zip_arch.namelist())
+        for dic_path in sorted(f for f in files if f.endswith(".dic")):
+            uid = dic_path[:-4]
+            aff_path = uid + ".aff"
+            if aff_path not in files:
+                continue
+            fp = tuple((n, zip_arch.getinfo(n).CRC,
+                        zip_arch.getinfo(n).file_size)
+                       for n in (aff_path, dic_path))
+            ret[uid] = cache.cache.hashbytes(
+                                repr(fp).encode("utf-8"),
+                                hunspell.Hunspell._hash_salt +
+                                matchdic.MatchDic._hash_salt).hexdigest()
+    return ret
+
+
+class DicBundle(object):
+    """
+    A read-only, memory-mapped dics bundle.
+    """
+
+    def __init__(self, path=BUNDLE_PATH):
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+            magic, version, _, toc_size = HEADER.unpack_from(self._map)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError("{} is not a valid dics bundle (or has an "
+                                 "unsupported version).".format(path))
+            self._data_offset = HEADER.size + toc_size
+            self.toc = json.loads(str(self._map[HEADER.size:
+                                                self._data_offset],
+                                      "utf-8"))
+            if self.toc.get("byteorder") != sys.byteorder:
+                raise ValueError("{} was built on another platform."
+                                 "".format(path))
+            # Whether some words still use our map.
+            self._shared = False
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        if getattr(self, "_map", None) is not None:
+            if not self._shared:
+                self._map.close()
+            # Else, it will be closed once all words using it are released.
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def has(self, uid, params_hash, fingerprint=None):
+        """
+        Whether given dic, pre-processed with given params, is available in
+        this bundle (and matches given fingerprint, if not None).
+        """
+        if params_hash not in self.toc["profiles"]:
+            return False
+        if uid not in self.toc["profiles"][params_hash]:
+            return False
+        return fingerprint is None or \
+               self.toc["fingerprints"].get(uid) == fingerprint
+
+    def get_compounds(self, uid, params_hash):
+        """
+        Returns the CompoundMatcher of given dic, or None.
+        """
+        data = self.toc["compounds"][params_hash].get(uid)
+        if data:
+            return matchdic.CompoundMatcher(*data)
+
+    def get_words(self, uid, params_hash, compact=False):
+        """
+        Returns the list of (per-length sets of) words of given dic, as
+        generated by MatchDic (as SortedWords instead of sets if compact is
+        True, directly using the mapped bundle, which then stays open as
+        long as they are alive).
+        """
+        lst = []
+        for offset, size, width in self.toc["profiles"][params_hash][uid]:
+            offset += self._data_offset
+            if compact:
+                ranges = array.array("I")
+                ranges.frombytes(self._map[offset:offset + RANGES_SIZE])
+                lst.append(matchdic.SortedWords.from_buffer(
+                                self._map, offset + RANGES_SIZE, width,
+                                ranges))
+                self._shared = True
+            else:
+                words = set(str(self._map[offset + RANGES_SIZE:
+                                          offset + size],
+                                "utf-8").split("\0"))
+                words.discard("")
+                lst.append(words)
+        return lst
+
+
+def build(zip_path=ZIP_DICS, path=BUNDLE_PATH, profiles=None, jobs=JOBS):
+    """
+    Builds a dics bundle at path, from all dics in zip_path, for all given
+    profiles (names from PROFILES, or all if None).
+    """
+    if profiles is None:
+        profiles = sorted(PROFILES)
+    h = hunspell.Hunspell()
+    h.load_dic_zip(zip_path, jobs=jobs)
+    toc = {"source": os.path.basename(zip_path),
+           "byteorder": sys.byteorder,
+           "fingerprints": get_fingerprints(zip_path),
+           "profiles": {},
+           "compounds": {},
+           "names": {}}
+    chunks = []
+    offset = 0
+    for name in profiles:
+        m = matchdic.MatchDic(h)
+        m.init(jobs=jobs, **PROFILES[name])
+        params_hash = m.get_params_hash()
+        toc["names"][name] = params_hash
+        prof = toc["profiles"][params_hash] = {}
+        toc["compounds"][params_hash] = {uid: c.to_data()
+                                         for uid, c in m.compounds.items()}
+        for uid in sorted(m.ids):
+            prof[uid] = []
+            for words in m.ids[uid]:
+                words = sorted(w.encode("utf-8") for w in words)
+                width = max(map(len, words), default=0) + 1
+                sw = matchdic.SortedWords.from_sorted(words, width)
+                data = sw.ranges.tobytes() + sw.to_buffer()
+                prof[uid].append((offset, len(data), width))
+                chunks.append(data)
+                offset += len(data)
+    toc = json.dumps(toc, sort_keys=True).encode("utf-8")
+    utils.printf("Writing dics bundle {}... ".format(path), end="")
+    size = cache.DiskCache._atomic_write(path, [HEADER.pack(MAGIC, VERSION,
+                                                            0, len(toc)),
+                                                toc] + chunks)
+    print("Done ({} bytes).".format(size))
+
+
+def get_user_dics(uid):
+    """
+    Returns the list of user words files of given dic (see DICS_USER
+    setting), None meaning those added to all dics.
+    """
+    paths = USER_DICS.get(uid, ())
+    if isinstance(paths, str):
+        return [paths]
+    return list(paths)
+
+
+# MatchDic objects already loaded, by params, dics and sources.
+_matchdics = {}
+
+
+def load_matchdic(ids=None, charset=None, charmap=None, func=None,
+                  minlen=None, maxlen=None, zip_path=ZIP_DICS,
+                  path=BUNDLE_PATH, jobs=JOBS):
+    """
+    Returns a MatchDic object inited with given params (see MatchDic.init()),
+    for given dics ids (or all ones in zip_path, if None).
+    Words are taken from the dics bundle at path when it has them (and is up
+    to date), others are generated from Hunspell dics, as usual.
+    User words (see DICS_USER setting) are then added as overlays.
+    Loaded objects are kept for the life of the process, so further calls
+    with same params simply return the same object (never modify it!).
+    """
+    m = matchdic.MatchDic(None)
+    m.set_params(charset, charmap, func, minlen, maxlen)
+    params_hash = m.get_params_hash()
+    fingerprints = get_fingerprints(zip_path)
+    if ids is None:
+        ids = fingerprints.keys()
+    ids = list(ids)
+    try:
+        st = os.stat(path)
+        bundle = (path, st.st_mtime_ns, st.st_size)
+    except OSError:
+        bundle = None
+    key = (params_hash, tuple((uid, fingerprints.get(uid)) for uid in ids),
+           zip_path, USE_BUNDLE and bundle,
+           tuple((uid, tuple(get_user_dics(uid))) for uid in ids + [None]))
+    if key in _matchdics:
+        return _matchdics[key]
+    missing = list(ids)
+    if USE_BUNDLE and bundle:
+        try:
+            with DicBundle(path) as b:
+                for uid in ids:
+                    if b.has(uid, params_hash, fingerprints.get(uid)):
+                        m.ids[uid] = b.get_words(uid, params_hash,
+                                                 m.words_index == "sorted")
+                        m.words_ids[uid] = cache.cache.hashbytes(
+                                    params_hash.encode("ascii"),
+                                    fingerprints[uid].encode("ascii")
+                                    ).hexdigest()
+                        comp = b.get_compounds(uid, params_hash)
+                        if comp:
+                            m.compounds[uid] = comp
+                        missing.remove(uid)
+        except (OSError, ValueError) as e:
+            print("Could not use dics bundle {} ({}).".format(path, e))
+    if missing:
+        h = hunspell.Hunspell()
+        h.load_dic_zip(zip_path, missing, jobs)
+        m.word_gen = h
+        m.init(missing, charset, charmap, func, minlen, maxlen, jobs)
+    for uid in m.ids:
+        for p in itertools.chain(get_user_dics(uid), get_user_dics(None)):
+            m.add_user_words(uid, p)
+    _matchdics[key] = m
+    return m
+
+
+def main():
+    # The argparse is much nicer than directly using sys.argv...
+    # Try 'program.py -h' to see! ;)
+
+    import argparse
+    parser = argparse.ArgumentParser(description=""
+                                     "Build or inspect the precompiled "
+                                     "dics bundle.")
+    parser.add_argument('--debug', action="store_true", default=False,
+                        help="Enable debug mode.")
+    parser.add_argument('--cache-stats', action="store_true", default=False,
+                        help="Print disk cache statistics (as JSON) on "
+                             "stderr at exit.")
+
+    sparsers = parser.add_subparsers(dest="command")
+
+    bparser = sparsers.add_parser('build', help="Build the dics bundle.")
+    bparser.add_argument('-z', '--zip', default=ZIP_DICS,
+                         help="The zip archive of Hunspell dics to use.")
+    bparser.add_argument('-o', '--ofile', default=BUNDLE_PATH,
+                         help="The bundle file to write.")
+    bparser.add_argument('-p', '--profiles', nargs="*",
+                         choices=sorted(PROFILES),
+                         help="The pre-processing profiles to store "
+                              "(all if not given).")
+    bparser.add_argument('-j', '--jobs', type=int, default=JOBS,
+                         help="Number of worker processes (one per CPU if "
+                              "not given).")
+
+    iparser = sparsers.add_parser('info', help="Show content of a bundle.")
+    iparser.add_argument('-i', '--ifile', default=BUNDLE_PATH,
+                         help="The bundle file to inspect.")
+
+    sparsers.add_parser('about', help="About dics bundles…")
+
+    args = parser.parse_args()
+    utils.DEBUG = args.debug
+    if args.cache_stats:
+        cache.dump_stats_at_exit()
+
+    if args.command == "build":
+        build(args.zip, args.ofile, args.profiles, args.jobs)
+
+    elif args.command == "info":
+        with DicBundle(args.ifile) as b:
+            fingerprints = get_fingerprints(ZIP_DICS)
+            names = {v: k for k, v in b.toc["names"].items()}
+            for params_hash, prof in sorted(b.toc["profiles"].items()):
+                print("Profile {}:".format(names.get(params_hash,
+                                                     params_hash)))
+                for uid, buckets in sorted(prof.items()):
+                    up2date = (b.toc["fingerprints"].get(uid) ==
+                               fingerprints.get(uid))
+                    print("    {}: {} bytes{}".format(
+                            uid, sum(s for o, s, w in buckets),
+                            "" if up2date else " (outdated)"))
+
+    elif args.command == "about":
+        print(__about__)
+
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
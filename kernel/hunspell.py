@@ -25,8 +25,9 @@
 ########################################################################
 
 
-import sys
 import os
+import codecs
+import array
 import itertools
 import re
 
@@ -48,8 +49,54 @@ spaces, though (several tens of Mb).
 
 
 ZIP_DICS = settings.HUNSPELL_ZIP_DICS
+USE_FINGERPRINTS = settings.HUNSPELL_FINGERPRINTS
 DO_CACHE = settings.CCH_USE
 CACHE_PREFIX = "hunspell"
+INFINITY = float("inf")
+
+# Hunspell’s encodings (SET directive) python does not know under that name.
+ENCODINGS = {"microsoft-cp1251": "cp1251", "tis620-2533": "tis-620"}
+SET_REGEX = re.compile(rb"^SET[ \t]+(\S+)", re.M)
+
+
+class BaseWords(object):
+    """
+    A compact, read-only list of (word, classes) base words.
+    Words are stored in a single concatenated string, with an array of their
+    end offsets, and their classes as ids (array) into a list of distinct
+    (interned) combinations of classes.
+    This saves millions of small objects (and makes pickles much lighter).
+    """
+
+    __slots__ = ("buf", "offsets", "combo_ids", "combos")
+
+    def __init__(self, words=(), combo_ids=(), combos=()):
+        """
+        words and combo_ids are iterables of same length, combos the list
+        of combinations of classes combo_ids refer to.
+        """
+        words = list(words)  # May be a one-shot iterator.
+        self.buf = "".join(words)
+        self.offsets = array.array("I", itertools.accumulate(map(len, words)))
+        self.combo_ids = array.array("I", combo_ids)
+        self.combos = list(combos)
+
+    def __getstate__(self):
+        return self.buf, self.offsets, self.combo_ids, self.combos
+
+    def __setstate__(self, state):
+        self.buf, self.offsets, self.combo_ids, self.combos = state
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __iter__(self):
+        buf = self.buf
+        combos = self.combos
+        start = 0
+        for end, cid in zip(self.offsets, self.combo_ids):
+            yield buf[start:end], combos[cid]
+            start = end
 
 
 class Hunspell(object):
@@ -60,7 +107,7 @@ class Hunspell(object):
 
     # Used to ensure cached data was cached with same version.
     # Change that when modifying parsing code!
-    _hash_salt = b"1.0.0"
+    _hash_salt = b"1.4.0"
 
     def __init__(self):
         self.reset()
@@ -71,12 +118,12 @@ class Hunspell(object):
 
     def get_hash(self, uid):
         """
-        Returns a copy of aff hash, updated with dic hash value.
+        Returns a new hash of both aff and dic hash values.
         """
         if uid in self.dics:
-            hsh = self.dics[uid]["aff_hash"].copy()
-            hsh.update(self.dics[uid]["dic_hash"].digest())
-            return hsh
+            return cache.cache.hashbytes(self.dics[uid]["aff_hash"].digest() +
+                                         self.dics[uid]["dic_hash"].digest(),
+                                         self._hash_salt)
 
     def reset(self, uid=None):
         """
@@ -86,9 +133,15 @@ class Hunspell(object):
             self.dics[uid] = {"flag_mode": "ASCII",
                               "af_map": {},
                               "af_classes": {},
-                              "base_words": [],
+                              "base_words": BaseWords(),
+                              "compound": {"min": 3, "flags": {},
+                                           "rules": []},
+                              "compound_parts": {},
+                              "encoding": "latin-1",
                               "aff_hash": None,
-                              "dic_hash": None}
+                              "dic_hash": None,
+                              "plans": {},
+                              "bounds": {}}
         else:
             self.dics = {}
 
@@ -97,33 +150,42 @@ class Hunspell(object):
         Helper func.
         """
         # aff (rules) part.
-        key = (CACHE_PREFIX, uid, self.dics[uid]["aff_hash"])
-        if DO_CACHE and key in cache.cache:
-            c = cache.cache[key]
-            self.dics[uid]["flag_mode"] = c[0]
-            self.dics[uid]["af_map"] = c[1]
-            self.dics[uid]["af_classes"] = c[2]
-        else:
+        def _parse_aff():
             utils.printf("Parsing {}’s aff rules file... ".format(uid), end="")
             self.parse_aff(self.dics[uid], aff)
-            if DO_CACHE:
-                c = (self.dics[uid]["flag_mode"], self.dics[uid]["af_map"],
-                     self.dics[uid]["af_classes"])
-                key = (CACHE_PREFIX, uid, self.dics[uid]["aff_hash"])
-                cache.cache[key] = c
             print("Done.")
-        # dicc (base words) part.
-        key = (CACHE_PREFIX, uid, self.dics[uid]["dic_hash"])
-        if DO_CACHE and key in cache.cache:
-            bw = cache.cache[key]
-            self.dics[uid]["base_words"] = bw
+            return (self.dics[uid]["flag_mode"], self.dics[uid]["af_map"],
+                    self.dics[uid]["af_classes"], self.dics[uid]["compound"],
+                    self.dics[uid]["encoding"])
+
+        if DO_CACHE:
+            key = (CACHE_PREFIX, uid, self.dics[uid]["aff_hash"])
+            c = cache.cache.get_or_build(key, _parse_aff)
+            self.dics[uid]["flag_mode"] = c[0]
+            self.dics[uid]["af_map"] = c[1]
+            self.dics[uid]["af_classes"] = c[2]
+            self.dics[uid]["compound"] = c[3]
+            self.dics[uid]["encoding"] = c[4]
         else:
-            utils.printf("Parsing {}’s dic base words file... ".format(uid), end="")
+            _parse_aff()
+
+        # dic (base words) part.
+        def _parse_dic():
+            utils.printf("Parsing {}’s dic base words file... ".format(uid),
+                         end="")
             self.parse_dic(self.dics[uid], dic)
-            if DO_CACHE:
-                key = (CACHE_PREFIX, uid, self.dics[uid]["dic_hash"])
-                cache.cache[key] = self.dics[uid]["base_words"]
             print("Done.")
+            return (self.dics[uid]["base_words"],
+                    self.dics[uid]["compound_parts"])
+
+        if DO_CACHE:
+            # Parsed dic also depends on aff content (flags)!
+            key = (CACHE_PREFIX, uid, self.get_hash(uid))
+            c = cache.cache.get_or_build(key, _parse_dic)
+            self.dics[uid]["base_words"] = c[0]
+            self.dics[uid]["compound_parts"] = c[1]
+        else:
+            _parse_dic()
 
     def load_dic_file(self, dic_path, aff_path=None, uid=None):
         """
@@ -135,47 +197,153 @@ class Hunspell(object):
             aff_path = dic_path[:-3] + "aff"
         if uid == None:
             uid = dic_path
-        with open(aff_path) as aff, open(dic_path) as dic:
-            self.reset(uid)
-            # First compute hashes.
-            self.dics[uid]["aff_hash"] = cache.cache.hashfile(aff_path,
-                                                              self._hash_salt)
-            self.dics[uid]["dic_hash"] = cache.cache.hashfile(dic_path,
-                                                              self._hash_salt)
-            # And then, parse data (or load from cache).
-            self._load_dic(uid, aff, dic)
-
-    def load_dic_zip(self, zip_path, names=[]):
+        def _read(path):
+            with open(path, "rb") as f:
+                return f.read()
+
+        self.reset(uid)
+        aff = _read(aff_path)
+        dic = _read(dic_path)
+        # First compute hashes.
+        self.dics[uid]["aff_hash"] = cache.cache.hashbytes(aff,
+                                                           self._hash_salt)
+        self.dics[uid]["dic_hash"] = cache.cache.hashbytes(dic,
+                                                           self._hash_salt)
+        # And then, parse data (or load from cache).
+        self._load_dic(uid, self._read_lines(uid, lambda: aff, True),
+                       self._read_lines(uid, lambda: dic, False))
+
+    @staticmethod
+    def _get_encoding(aff):
+        """
+        Returns the python codec matching the SET directive of given aff raw
+        content (ISO8859-1 if none, as hunspell does).
+        """
+        m = SET_REGEX.search(aff)
+        if m:
+            enc = m.group(1).decode("ascii", "replace").lower()
+        else:
+            enc = "iso8859-1"
+        try:
+            enc = codecs.lookup(ENCODINGS.get(enc, enc)).name
+        except LookupError:
+            enc = "latin-1"  # At least, never fails…
+        if enc == "utf-8":
+            enc = "utf-8-sig"  # Just in case there would be a BOM.
+        return enc
+
+    def _read_lines(self, uid, read, is_aff):
+        """
+        Yields lines of given uid’s aff (if is_aff) or dic content.
+        read must return that raw content, it is only called when iterating
+        (i.e. not at all when parsed data comes from cache). The whole
+        content is decoded at once, using the encoding set by the aff.
+        """
+        data = read()
+        if is_aff:
+            self.dics[uid]["encoding"] = self._get_encoding(data)
+        yield from data.decode(self.dics[uid]["encoding"]).split("\n")
+
+    def _hash_zip_member(self, zip_arch, name, fingerprint):
+        """
+        Returns a (hash, data) tuple for given zip member.
+        data is the decompressed content of the member, read in the same pass
+        as the hash is computed, or None if the hash could be found in cache
+        from member's fingerprint (zip CRC and size, and archive mtime), in
+        which case the member is not read at all.
+        """
+        fp_key = None
+        if DO_CACHE and USE_FINGERPRINTS:
+            info = zip_arch.getinfo(name)
+            fp = repr((name, info.CRC, info.file_size, fingerprint))
+            fp_key = (CACHE_PREFIX, "fingerprints",
+                      cache.cache.hashbytes(fp.encode("utf-8"),
+                                            self._hash_salt))
+            try:
+                if fp_key in cache.cache:
+                    return cache.HashDigest(cache.cache[fp_key]), None
+            except KeyError:
+                pass
+        data = []
+        with zip_arch.open(name) as f:
+            hsh = cache.cache.hashiostream(f, self._hash_salt, tee=data)
+        if fp_key:
+            cache.cache[fp_key] = hsh.digest()
+        return hsh, b"".join(data)
+
+    def _is_cached(self, uid):
+        """
+        Whether parsed data of given (hashed) dic is available from cache.
+        """
+        if not DO_CACHE:
+            return False
+        return ((CACHE_PREFIX, uid, self.dics[uid]["aff_hash"]) in cache.cache
+                and (CACHE_PREFIX, uid, self.get_hash(uid)) in cache.cache)
+
+    def load_dic_zip(self, zip_path, names=[], jobs=1):
         """
         Load some dics from a zip archive.
         names is an iterable of dic names (without .dic/.aff extensions), if
         empty all dics from archive will be loaded.
+        Each member of the archive is decompressed at most once (and not at
+        all when its hash is known from its fingerprint, and its parsed
+        data is available from cache).
+        Dics not available from cache are parsed in parallel by up to jobs
+        worker processes (None for one per CPU).
         """
-        def bytes2str(lines):
-            for l in lines:
-                # XXX For now, we assume encoding is utf-8!
-                yield l.decode("utf-8")
+        def _lines(zip_arch, uid, path, data):
+            # Only read member if really needed (i.e. not in cache)!
+            if data is None:
+                read = lambda: zip_arch.read(path)
+            else:
+                read = lambda: data
+            return self._read_lines(uid, read, path.endswith(".aff"))
 
         import zipfile
         with zipfile.ZipFile(zip_path) as zip_arch:
+            fingerprint = os.stat(zip_path).st_mtime_ns
             files = set(zip_arch.namelist())
             if not names:
                 names = (f[:-4] for f in files if f.endswith(".dic"))
             names = ((n, n + ".dic", n + ".aff") for n in names
                      if {n + ".dic", n + ".aff"} <= files)
+            todo = []
             for uid, dic_path, aff_path in names:
                 self.reset(uid)
                 # First compute hashes.
-                aff = zip_arch.open(aff_path)
-                dic = zip_arch.open(dic_path)
-                self.dics[uid]["aff_hash"] = \
-                    cache.cache.hashiostream(aff, self._hash_salt)
-                self.dics[uid]["dic_hash"] = \
-                    cache.cache.hashiostream(dic, self._hash_salt)
-                # And then, parse data (or load from cache).
-                aff = zip_arch.open(aff_path)
-                dic = zip_arch.open(dic_path)
-                self._load_dic(uid, bytes2str(aff), bytes2str(dic))
+                aff_hash, aff = self._hash_zip_member(zip_arch, aff_path,
+                                                      fingerprint)
+                dic_hash, dic = self._hash_zip_member(zip_arch, dic_path,
+                                                      fingerprint)
+                self.dics[uid]["aff_hash"] = aff_hash
+                self.dics[uid]["dic_hash"] = dic_hash
+                todo.append((uid, aff_path, aff, dic_path, dic))
+
+            pool = None
+            if jobs != 1:
+                para = [t for t in todo if not self._is_cached(t[0])]
+                pool = utils.process_pool(jobs, len(para))
+            if pool:
+                utils.printf("Parsing {} dics in parallel... "
+                             "".format(len(para)), end="")
+                with pool:
+                    futures = {t[0]: pool.submit(_load_dic_zip_worker,
+                                                 zip_path, t[0])
+                               for t in para}
+                    # Meanwhile, load cached ones ourself.
+                    for uid, aff_path, aff, dic_path, dic in todo:
+                        if uid not in futures:
+                            self._load_dic(uid,
+                                           _lines(zip_arch, uid, aff_path, aff),
+                                           _lines(zip_arch, uid, dic_path, dic))
+                    for uid, f in futures.items():
+                        self.dics[uid] = f.result()
+                print("Done.")
+            else:
+                for uid, aff_path, aff, dic_path, dic in todo:
+                    # Parse data (or load from cache).
+                    self._load_dic(uid, _lines(zip_arch, uid, aff_path, aff),
+                                   _lines(zip_arch, uid, dic_path, dic))
 
     # -------------------------------------------------------------------------
     # Parsing!
@@ -224,6 +392,67 @@ class Hunspell(object):
         ret += spfx + ssfx
         return ret
 
+    @staticmethod
+    def _compound_rule_parse(rule):
+        """
+        Parses a COMPOUNDRULE pattern (like "(aa)*(bb)c?"), returning a list
+        of (flags, quantifier) items (see get_compounds()).
+        """
+        ret = []
+        i = 0
+        while i < len(rule):
+            if rule[i] == '(':
+                end = rule.find(')', i + 1)
+                if end < 0:
+                    end = len(rule)
+                flag = rule[i + 1:end]
+                i = end + 1
+            else:
+                flag = rule[i]
+                i += 1
+            q = ""
+            if i < len(rule) and rule[i] in "*?":
+                q = rule[i]
+                i += 1
+            ret.append(((flag,), q))
+        return ret
+
+    @staticmethod
+    def _build_index(rules, sfx):
+        """
+        Builds the dispatch index of a class' rules: a trie keyed on the last
+        (for suffixes) or first (for prefixes) chars of words, each node being
+        a (children, groups) tuple.
+        Rules are grouped by condition, each group being stored in the
+        deepest node reachable with literal chars of its condition, as a
+        (regex, length, rules) tuple – regex being None when the path to the
+        node already is the whole condition, and rules a list of
+        (strip_length, add, recursive_classes) tuples.
+        """
+        groups = {}
+        for r in rules:
+            add, rc_clss = r["add"]
+            groups.setdefault(r["if"] or (), []).append(
+                                (len(r["strip"]), add,
+                                 tuple(tuple(rc) for rc in rc_clss)))
+        root = ({}, [])
+        for cond, rls in groups.items():
+            node = root
+            atoms = reversed(cond) if sfx else cond
+            depth = 0
+            for a in atoms:
+                # Literal (possibly escaped) single char?
+                ch = a[1:] if a.startswith('\\') else a
+                if len(ch) != 1 or a == '.':
+                    break
+                node = node[0].setdefault(ch, ({}, []))
+                depth += 1
+            if depth == len(cond):
+                node[1].append((None, depth, rls))
+            else:
+                node[1].append((re.compile("".join(cond)), len(cond), rls))
+        return root
+
     # And now, real parser funcs.
     def parse_aff(self, dic, lines):
         """
@@ -233,34 +462,38 @@ class Hunspell(object):
         af = 0
         curr = ""
 
-        def _if_preprocess(regex, is_sfx):
+        def _cond_parse(cond):
             """
-            Parses the pseudo-regex syntax of hunspell conditions, generating
-            a valid regex one.
+            Parses the pseudo-regex syntax of hunspell conditions, returning
+            a tuple of per-char regex atoms (one per char of the condition),
+            or None if there is no condition.
             """
-            if regex == '.':
+            if cond == '.':
                 return None  # No condition!
-            ret = [regex]
-            if '-' in regex and '[' in regex:
-                # Just make sure '-' is first char if in [] sets...
-                temp = regex.split('[')
-                reg = re.compile(r"(\^?)(.*?)(-)(.*?\].*)")
-                ret = [temp[0]]
-                for t in temp[1:]:
-                    m = reg.match(t)
-                    if m:
-                        grps = m.goups()
-                        ret.append("".join((m[0], m[2], m[1], m[3])))
-                    else:
-                        ret.append(t)
-            if is_sfx:
-                return re.compile(".*?" + "[".join(ret))
-            else:
-                return re.compile("[".join(ret) + ".*")
+            ret = []
+            i = 0
+            while i < len(cond):
+                if cond[i] == '[':
+                    end = cond.find(']', i + 1)
+                    if end < 0:
+                        end = len(cond)
+                    chars = cond[i + 1:end]
+                    neg = chars.startswith('^')
+                    if neg:
+                        chars = chars[1:]
+                    ret.append("[" + ("^" if neg else "") +
+                               "".join(re.escape(c) for c in chars) + "]")
+                    i = end + 1
+                else:
+                    ret.append('.' if cond[i] == '.' else re.escape(cond[i]))
+                    i += 1
+            return tuple(ret)
 
         af_map = dic["af_map"]
         af_classes = dic["af_classes"]
         flag_mode = dic["flag_mode"]
+        compound = dic["compound"]
+        compound_rules = None
         for l in lines:
             l = l.split()
             if not l:
@@ -271,6 +504,17 @@ class Hunspell(object):
                 if af:
                     af_map[str(af)] = l[1]
                 af += 1
+            elif l[0] == "COMPOUNDMIN":
+                compound["min"] = max(1, int(l[1]))
+            elif l[0] in {"COMPOUNDFLAG", "COMPOUNDBEGIN", "COMPOUNDMIDDLE",
+                          "COMPOUNDEND", "ONLYINCOMPOUND"}:
+                compound["flags"][l[0]] = l[1]
+            elif l[0] == "COMPOUNDRULE":
+                if compound_rules is None:
+                    compound_rules = 0  # First line is the rules count.
+                else:
+                    compound["rules"].append(
+                                    self._compound_rule_parse(l[1]))
             elif l[0] in {"PFX", "SFX"}:
                 if l[1] != curr:
                     # Add a new prefix/suffix class.
@@ -302,7 +546,7 @@ class Hunspell(object):
                         l3[0] = l3[0].replace('\\', '')
                         l3[0] = l3[0].replace("##", '\\')
                     r = {"strip": l[2], "add": [l3[0], l3[1]],
-                         "if": _if_preprocess(l[4], af_classes[curr]["sfx"])}
+                         "if": _cond_parse(l[4])}
                     af_classes[curr]["rules"].append(r)
 
         # Now, we can pre-process "recursive" classes calls found in
@@ -313,6 +557,9 @@ class Hunspell(object):
                 clss = af_map.get(clss, clss)
                 clss = self._classes_split(flag_mode, clss)
                 r["add"][1] = self._classes_preprocess(af_classes, clss)
+        # And build the rules dispatch indices.
+        for c in af_classes.values():
+            c["index"] = self._build_index(c["rules"], c["sfx"])
 
     def parse_dic(self, dic, lines):
         """
@@ -322,7 +569,18 @@ class Hunspell(object):
         flag_mode = dic["flag_mode"]
         af_map = dic["af_map"]
         af_classes = dic["af_classes"]
-        base_words = dic["base_words"]
+        words = []
+        combo_ids = []
+        combos = [[]]  # No classes is always combination 0.
+        combos_map = {(): 0}
+        compound_parts = dic["compound_parts"]
+        cflags = set(dic["compound"]["flags"].values())
+        for r in dic["compound"]["rules"]:
+            for flags, q in r:
+                cflags.update(flags)
+        only_in_compound = dic["compound"]["flags"].get("ONLYINCOMPOUND")
+        # Many words share the same flags, process each set of them once.
+        flags_cache = {}
         for l in lines:
             l = l.rstrip("\n\r")
             if first_l:
@@ -333,16 +591,56 @@ class Hunspell(object):
                 continue
             # XXX This does not handle escaped '/'!
             l = l.split('/')
-            l[0] = l[0].split()[0]
-            classes = []
-            if len(l) > 1:
-                l[1] = l[1].split()[0]
-                l[1] = af_map.get(l[1], l[1])
-                l[1] = self._classes_split(flag_mode, l[1])
-                classes = self._classes_preprocess(af_classes, l[1])
-            # XXX In case we want to support "user dics", we'll have to make
-            #     this a key: value (dict) stuff...
-            base_words.append((l[0], classes))
+            w = l[0].split()[0]
+            if len(l) == 1:
+                words.append(w)
+                combo_ids.append(0)
+                continue
+            flags = l[1].split()[0]
+            c = flags_cache.get(flags)
+            if c is None:
+                fl = af_map.get(flags, flags)
+                fl = list(self._classes_split(flag_mode, fl))
+                classes = self._classes_preprocess(af_classes, fl)
+                cid = combos_map.setdefault(tuple(classes), len(combos))
+                if cid == len(combos):
+                    combos.append(classes)
+                c = flags_cache[flags] = (cid, cflags.intersection(fl),
+                                          only_in_compound in fl)
+            cid, cfl, only_in = c
+            # Compound parts (base forms only).
+            for f in cfl:
+                compound_parts.setdefault(f, set()).add(w)
+            if only_in:
+                continue
+            words.append(w)
+            combo_ids.append(cid)
+        dic["base_words"] = BaseWords(words, combo_ids, combos)
+
+    def get_compounds(self, uid):
+        """
+        Returns compounding data of given dic, as a (rules, parts, minlen)
+        tuple, or None if it does not allow compound words.
+        rules is a list of patterns, each being a list of (flags, quantifier)
+        items (a part matches an item if it has one of its flags, quantifier
+        is either "", "?" or "*"), parts a dict {flag: set of words}, and
+        minlen the minimal length of a part.
+        Compounds defined by COMPOUNDFLAG (and its BEGIN/MIDDLE/END variants)
+        are converted into such a pattern too.
+        """
+        compound = self.dics[uid]["compound"]
+        parts = self.dics[uid]["compound_parts"]
+        rules = list(compound["rules"])
+        flags = compound["flags"]
+        if {"COMPOUNDFLAG", "COMPOUNDBEGIN", "COMPOUNDEND"} & flags.keys():
+            def _flags(*names):
+                return tuple(flags[n] for n in names if n in flags)
+            rules.append([(_flags("COMPOUNDFLAG", "COMPOUNDBEGIN"), ""),
+                          (_flags("COMPOUNDFLAG", "COMPOUNDMIDDLE"), "*"),
+                          (_flags("COMPOUNDFLAG", "COMPOUNDEND"), "")])
+        if not rules or not parts:
+            return None
+        return rules, parts, compound["min"]
 
     def gen_words(self, dics=None, minlen=None, maxlen=None, unique=False):
         """
@@ -351,8 +649,10 @@ class Hunspell(object):
         If dics is not None, it must be an iterable of dic names (uids) present
         in self.dics.
         Is not None, minlen and maxlen limit minimal/maximal length of
-        generated words.
-        If unique is True, you can be sure it will not yield twice a same word.
+        generated words (minlen <= len(word) < maxlen). Derivations that
+        cannot produce any word in those bounds are not even computed.
+        A same word is never yielded twice for a same base word. If unique is
+        True, you can be sure it will not yield twice a same word at all.
         However, this option is heavy on memory (several hundreds of Mo with
         current four dics in dics.zip…).
         """
@@ -370,62 +670,205 @@ class Hunspell(object):
         for k in dics:
             dic = self.dics[k]
             for w, af in dic["base_words"]:
-                # XXX Avoid to yield several times the same word...
-                #     Only per-baseword guard, unless unique is set.
-                if not unique or w not in words:
-                    if bypass_len or minlen < len(w) < maxlen:
+                if not unique:
+                    words = set()
+                if w not in words:
+                    if bypass_len or minlen <= len(w) < maxlen:
                         yield w
-                    if unique:
-                        words.add(w)
-                    else:
-                        words = {w}
-                pfx = []
-                sfx = []
-                comb = []
-                for clss in af:
-                    for _w in self.apply_class(dic, w, *clss):
-                        if (bypass_len or minlen <= len(_w) < maxlen) and \
-                           _w not in words:
-                            yield _w
-                            words.add(_w)
+                    words.add(w)
+                if not af:
+                    continue
+                if bypass_len:
+                    derived = self._expand(dic, w, af)
+                else:
+                    derived = self._expand(dic, w, af, minlen, maxlen)
+                for _w in derived:
+                    if (bypass_len or minlen <= len(_w) < maxlen) and \
+                       _w not in words:
+                        yield _w
+                        words.add(_w)
 
-    def apply_class(self, dic, word, c, *clss):
+    @staticmethod
+    def _get_plan(dic, clss):
+        """
+        Returns the "plan" of a combination of classes, i.e. a tuple of
+        (sfx, index, remaining_classes) for each defined class in clss,
+        remaining_classes being the classes still to apply after that one.
+        Plans are memoized in dic.
         """
-        Applies class c to word, and then recursively calls itself
-        with remaining clss classes, and/or c's own recursive classes.
-        Yeah, recursive nightmare!
-        """
-        if clss:
-            for _w in self.apply_class(dic, word, *clss):
-                yield _w
-        if c not in dic["af_classes"]:
-            return
-        c = dic["af_classes"][c]
-        for r in c["rules"]:
-            if r["if"] and not r["if"].match(word):
+        af_classes = dic["af_classes"]
+        plan = tuple((af_classes[c]["sfx"], af_classes[c]["index"],
+                      tuple(clss[i + 1:]))
+                     for i, c in enumerate(clss) if c in af_classes)
+        dic["plans"][clss] = plan
+        return plan
+
+    def _get_bounds(self, dic, clss, conts):
+        """
+        Returns a (lo, hi) tuple, bounds of the length variation between the
+        word of a (word, clss, conts) state (see _expand()) and all words
+        derived from it, computed from rules' strip/add lengths (conditions
+        are ignored, so these are conservative bounds).
+        Memoized in dic.
+        """
+        bounds = dic["bounds"]
+        key = (clss, conts)
+        b = bounds.get(key)
+        if b is not None:
+            return b
+        # Recursion guard (in case classes would recursively use themselves).
+        bounds[key] = (-INFINITY, INFINITY)
+        lo, hi = INFINITY, -INFINITY  # Nothing derived at all.
+        af_classes = dic["af_classes"]
+        for i, c in enumerate(clss):
+            if c not in af_classes:
                 continue
-            add, rc_clss = r["add"]
-            if c["sfx"]:
-                if r["strip"]:
-                    _w = word[:-len(r["strip"])] + add
-                else:
-                    _w = word + add
-            else:  # Prefix...
-                if r["strip"]:
-                    _w = add + word[len(r["strip"]):]
-                else:
-                    _w = add + word
-            yield _w
-            # Recursive process of other classes.
-            if clss:
-                for _r_w in self.apply_class(dic, _w, *clss):
-                    yield _r_w
-            # If this rule recursively uses other rules...
-            # XXX Arg...
-            if rc_clss:
-                for _rc_cls in rc_clss:
-                    for _rc_w in self.apply_class(dic, _w, *_rc_cls):
-                        yield _rc_w
-                        if clss:
-                            for _r_w in self.apply_class(dic, _rc_w, *clss):
-                                yield _r_w
+            rest = tuple(clss[i + 1:])
+            rc_conts = ((rest,) + conts) if rest else conts
+            # Words derived by c’s rules may go on with rest and conts...
+            subs = [(0, 0)]
+            if rest:
+                subs.append(self._get_bounds(dic, rest, conts))
+            subs += [self._get_bounds(dic, cc, conts[j + 1:])
+                     for j, cc in enumerate(conts)]
+            sub_lo = min(b[0] for b in subs)
+            sub_hi = max(b[1] for b in subs)
+            rules = {(len(r["add"][0]) - len(r["strip"]),
+                      tuple(tuple(rc) for rc in r["add"][1]))
+                     for r in af_classes[c]["rules"]}
+            for delta, rc_clss in rules:
+                # ... and with their own recursive classes.
+                l, h = sub_lo, sub_hi
+                for rc in rc_clss:
+                    rl, rh = self._get_bounds(dic, rc, rc_conts)
+                    l, h = min(l, rl), max(h, rh)
+                lo, hi = min(lo, delta + l), max(hi, delta + h)
+        bounds[key] = (lo, hi)
+        return lo, hi
+
+    @staticmethod
+    def _get_deltas(dic):
+        """
+        Returns the smallest and biggest length variations (len(add) -
+        len(strip)) of all rules of dic. Memoized in dic.
+        """
+        deltas = dic["bounds"].get(None)
+        if deltas is None:
+            deltas = [len(r["add"][0]) - len(r["strip"])
+                      for c in dic["af_classes"].values() for r in c["rules"]]
+            deltas = dic["bounds"][None] = (min(deltas, default=0),
+                                            max(deltas, default=0))
+        return deltas
+
+    def _expand(self, dic, word, af, minlen=None, maxlen=None):
+        """
+        Yields all words derived from word by applying af combinations of
+        classes (as generated by _classes_preprocess) – may yield a same word
+        several times.
+        This is an iterative worklist: each state is a (word, classes, conts)
+        tuple, conts being a stack of combinations of classes to apply to
+        every word derived from that state (needed by rules using
+        recursively other classes). States already processed for this word
+        are skipped.
+        If minlen/maxlen are given, states that cannot derive any word in
+        [minlen, maxlen) are skipped as well.
+        """
+        def in_bounds(st):
+            lo, hi = bounds.get(st[1:]) or self._get_bounds(dic, *st[1:])
+            return len(st[0]) + hi >= minlen and len(st[0]) + lo < maxlen
+
+        plans = dic["plans"]
+        bounds = dic["bounds"]
+        work = [(word, tuple(clss), ()) for clss in af]
+        seen = set(work)
+        prune = minlen is not None and maxlen is not None
+        if prune:
+            # Words derived from a state are always within its own bounds,
+            # so if those are all inside [minlen, maxlen), no need to check
+            # anything further.
+            ln = len(word)
+            prune = False
+            for st in work:
+                lo, hi = (bounds.get(st[1:]) or
+                          self._get_bounds(dic, st[1], st[2]))
+                if not (minlen <= ln + lo and ln + hi < maxlen):
+                    prune = True
+                    break
+        if prune:
+            work = [st for st in work if in_bounds(st)]
+            # And a state's hi (resp. lo) bound is always at least (resp. at
+            # most) the smallest (resp. biggest) length variation of a single
+            # rule, so only words out of [min_edge, max_edge) are worth a
+            # check.
+            d_min, d_max = self._get_deltas(dic)
+            min_edge, max_edge = minlen - d_min, maxlen - d_max
+        while work:
+            w, clss, conts = work.pop()
+            plan = plans.get(clss)
+            if plan is None:
+                plan = self._get_plan(dic, clss)
+            ln = len(w)
+            for sfx, index, rest in plan:
+                rc_conts = ((rest,) + conts) if rest else conts
+                # Walk the index from end (or start) of word, to get
+                # candidate rules.
+                groups = list(index[1])
+                node = index
+                for ch in (reversed(w) if sfx else w):
+                    node = node[0].get(ch)
+                    if node is None:
+                        break
+                    groups += node[1]
+                for cond, n, rules in groups:
+                    if cond is not None:
+                        if n > ln:
+                            continue
+                        if sfx:
+                            if not cond.fullmatch(w, ln - n):
+                                continue
+                        elif not cond.match(w):
+                            continue
+                    for strip, add, rc_clss in rules:
+                        if sfx:
+                            _w = (w[:-strip] if strip else w) + add
+                        else:  # Prefix...
+                            _w = add + w[strip:]
+                        yield _w
+                        if not (rc_conts or rc_clss):
+                            continue
+                        new = [(_w, c, conts[i + 1:])
+                               for i, c in enumerate(conts)]
+                        if rest:
+                            new.append((_w, rest, conts))
+                        new += ((_w, rc, rc_conts) for rc in rc_clss)
+                        check = prune and not (min_edge <= len(_w) <
+                                               max_edge)
+                        for st in new:
+                            if st not in seen:
+                                seen.add(st)
+                                if not check or in_bounds(st):
+                                    work.append(st)
+
+    def apply_class(self, dic, word, c, *clss):
+        """
+        Applies class c to word, and then the remaining clss classes,
+        and/or c's own recursive classes.
+        """
+        return self._expand(dic, word, ((c,) + clss,))
+
+
+def _load_dic_zip_worker(zip_path, uid):
+    """
+    Process pool worker, returns parsed data of a single dic from a zip
+    archive (see Hunspell.load_dic_zip()).
+    """
+    h = Hunspell()
+    h.load_dic_zip(zip_path, (uid,))
+    dic = h.dics[uid]
+    # hashlib’s objects cannot be pickled.
+    for k in ("aff_hash", "dic_hash"):
+        dic[k] = cache.HashDigest(dic[k].digest())
+    # Our own exit handlers are not called in workers!
+    if cache.cache.is_loaded():
+        cache.cache.flush()
+    return dic
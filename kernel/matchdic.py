@@ -25,10 +25,9 @@
 ########################################################################
 
 
-import sys
+import array
+import bisect
 import itertools
-import time
-import string
 import pickle
 
 import settings
@@ -38,6 +37,277 @@ import kernel.utils as utils
 
 DO_CACHE = settings.CCH_USE
 CACHE_PREFIX = "matchdic"
+WORDS_INDEX = settings.DICS_WORDS_INDEX
+
+# Number of texts scored by each task of parallel MatchDic.score_many().
+SCORE_BATCH = 256
+
+
+class CompoundMatcher(object):
+    """
+    Checks whether a word is a valid compound, i.e. a concatenation of parts
+    matching one of the compound patterns (see Hunspell.get_compounds()),
+    without ever generating compounds themselves.
+    """
+
+    def __init__(self, rules, parts):
+        self.parts = {f: set(words) for f, words in parts.items() if words}
+        # Patterns with a mandatory item without any part can never match.
+        self.rules = [[(tuple(flags), q) for flags, q in r] for r in rules
+                      if all(q or self.parts.keys() & set(flags)
+                             for flags, q in r)]
+        # Parts matching each pattern item, and their max length.
+        self._items = {}
+        for r in self.rules:
+            for flags, q in r:
+                if flags not in self._items:
+                    words = set().union(*(self.parts.get(f, ())
+                                          for f in flags))
+                    self._items[flags] = (words,
+                                          max(map(len, words), default=0))
+
+    def to_data(self):
+        """
+        Returns (rules, parts) in a JSON-compatible form.
+        """
+        return ([[[list(flags), q] for flags, q in r] for r in self.rules],
+                {f: sorted(words) for f, words in self.parts.items()})
+
+    def match(self, word):
+        """
+        Returns True if word is a valid compound.
+        """
+        return any(self._match_rule(r, word) for r in self.rules)
+
+    def _match_rule(self, rule, word):
+        # Walk (position in word, position in pattern) states.
+        ln = len(word)
+        todo = [(0, 0)]
+        seen = set(todo)
+        while todo:
+            i, t = todo.pop()
+            if t == len(rule):
+                if i == ln:
+                    return True
+                continue
+            flags, q = rule[t]
+            nxt = []
+            if q:  # Optional item.
+                nxt.append((i, t + 1))
+            words, mx = self._items[flags]
+            for j in range(i + 1, min(ln, i + mx) + 1):
+                if word[i:j] in words:
+                    nxt.append((j, t if q == "*" else t + 1))
+            for st in nxt:
+                if st not in seen:
+                    seen.add(st)
+                    todo.append(st)
+        return False
+
+
+class WordsUnion(object):
+    """
+    A read-only union of several sets of words, without copying them.
+    """
+
+    __slots__ = ("sets",)
+
+    def __init__(self, *sets):
+        self.sets = sets
+
+    def __contains__(self, word):
+        for s in self.sets:
+            if word in s:
+                return True
+        return False
+
+    def __iter__(self):
+        for i, s in enumerate(self.sets):
+            prev = self.sets[:i]
+            for w in s:
+                if not any(w in p for p in prev):
+                    yield w
+
+
+class SortedWords(object):
+    """
+    A compact, read-only set of words of a same length: words are utf-8
+    encoded, NUL-padded to a same width, sorted, and stored in a single
+    bytes buffer, where they are looked up by binary search (only among
+    words starting with same byte).
+    This takes about ten times less memory than a set of str, and its
+    pickles are much quicker to load.
+    Words can also be looked up directly in a part of a bigger buffer (e.g.
+    a memory-mapped dics bundle), starting at offset.
+    """
+
+    __slots__ = ("buf", "offset", "width", "ranges")
+
+    def __init__(self, words=()):
+        self._set_words(sorted(w.encode("utf-8") for w in words))
+
+    @classmethod
+    def from_sorted(cls, words, width=None):
+        """
+        Returns a new SortedWords from a sorted list of utf-8 encoded words,
+        padded to given width (defaults to the longest word's length).
+        """
+        self = cls.__new__(cls)
+        self._set_words(words, width)
+        return self
+
+    @classmethod
+    def from_buffer(cls, buf, offset, width, ranges):
+        """
+        Returns a new SortedWords using (without copying it) the already
+        built buffer of words found in buf at offset, as stored by to_buffer().
+        buf must give bytes when sliced (like bytes or mmap objects).
+        """
+        self = cls.__new__(cls)
+        self.buf = buf
+        self.offset = offset
+        self.width = width
+        self.ranges = ranges
+        return self
+
+    def to_buffer(self):
+        """
+        Returns the buffer of words (see from_buffer()).
+        """
+        return self.buf[self.offset:self.offset + len(self) * self.width]
+
+    def _set_words(self, words, width=None):
+        w = self.width = max(map(len, words), default=0) \
+                         if width is None else width
+        self.buf = b"".join(b.ljust(w, b"\0") for b in words)
+        self.offset = 0
+        # ranges[b] is the index of first word starting with byte b.
+        self.ranges = array.array("I", (bisect.bisect_left(words, bytes((b,)))
+                                       for b in range(256)))
+        self.ranges.append(len(words))
+
+    def __getstate__(self):
+        return self.to_buffer(), self.width, self.ranges
+
+    def __setstate__(self, state):
+        self.buf, self.width, self.ranges = state
+        self.offset = 0
+
+    def __len__(self):
+        return self.ranges[-1]
+
+    def __iter__(self):
+        buf = self.buf
+        w = self.width
+        if not w:
+            return
+        for i in range(self.offset, self.offset + len(self) * w, w):
+            yield str(buf[i:i + w].rstrip(b"\0"), "utf-8")
+
+    def __contains__(self, word):
+        b = word.encode("utf-8")
+        w = self.width
+        # Trailing NULs would match padding (words never hold any NUL).
+        if not b or len(b) > w or not b[-1]:
+            return False
+        b = b.ljust(w, b"\0")
+        buf = self.buf
+        o = self.offset
+        lo, hi = self.ranges[b[0]], self.ranges[b[0] + 1]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            c = buf[o + mid * w:o + mid * w + w]
+            if c < b:
+                lo = mid + 1
+            elif c > b:
+                hi = mid
+            else:
+                return True
+        return False
+
+
+class TranslateTable(dict):
+    """
+    A str.translate() table, which (if strict) deletes all chars it does not
+    map, except those for which keep(char) is True (left untouched, e.g. to
+    be able to split translated texts as original ones).
+    Unknown chars are added to the table on first encounter, so that
+    str.translate() only ever calls back Python code once per char.
+    """
+
+    __slots__ = ("strict", "keep")
+
+    def __init__(self, table, strict=True, keep=None):
+        super().__init__(table)
+        self.strict = strict
+        self.keep = keep
+        if keep:
+            for c in list(self):
+                if keep(chr(c)):
+                    self[c] = c
+
+    def __missing__(self, c):
+        v = c
+        if self.strict and not (self.keep and self.keep(chr(c))):
+            v = None
+        self[c] = v
+        return v
+
+
+class WordsIndex(object):
+    """
+    A light automaton over per-length sets of words, finding all words
+    contained in a string in a single pass over it: words are indexed by
+    their heads (first HEAD_LEN chars), each head giving the lengths of words
+    starting with it, so that only those lengths are checked at each
+    position (shorter words are always checked).
+    Unlike a full trie, it costs a few Mo at most, even for huge dics.
+    """
+
+    HEAD_LEN = 3
+
+    def __init__(self, words, *sources):
+        """
+        words are the per-length sets of words used for lookups, sources
+        the per-length lists of sets (or words itself, by default) to
+        iterate over to build the index.
+        """
+        hl = self.HEAD_LEN
+        self.words = words
+        self.short = tuple(ln for ln, s in enumerate(words[:hl - 1], 1)
+                           if s)
+        heads = {}
+        for lst in sources or (words,):
+            for ln, s in enumerate(lst[hl - 1:], hl):
+                bit = 1 << ln
+                for h in {w[:hl] for w in s}:
+                    heads[h] = heads.get(h, 0) | bit
+        self.heads = {h: tuple(ln for ln in range(m.bit_length() - 1, 0, -1)
+                               if m >> ln & 1)
+                      for h, m in heads.items()}
+
+    def find(self, txt):
+        """
+        Returns all words found in txt, as a list of (length, start)
+        tuples, longest ones first (and leftmost ones first among same
+        length).
+        """
+        words = self.words
+        heads = self.heads
+        short = self.short
+        hl = self.HEAD_LEN
+        ln = len(txt)
+        ret = []
+        for i in range(ln):
+            lns = heads.get(txt[i:i + hl], ())
+            for l in lns:
+                if i + l <= ln and txt[i:i + l] in words[l - 1]:
+                    ret.append((l, i))
+            for l in short:
+                if i + l <= ln and txt[i:i + l] in words[l - 1]:
+                    ret.append((l, i))
+        ret.sort(key=lambda m: (-m[0], m[1]))
+        return ret
 
 
 class MatchDic(object):
@@ -61,42 +331,90 @@ class MatchDic(object):
             * An ids member returning a list of ids of all dics it handles.
             * A get_hash function, which must return an hash object (as
               generated by haslib module) for given uid.
-            * A gen_words function, taking a list of ids as parameter, and
-              returning a list (or better, a generator) of words.
+            * A gen_words function, taking a list of ids as parameter (and
+              optional minlen/maxlen bounds), and returning a list (or
+              better, a generator) of words.
         """
         self.ids = {}
+        # Identifiers of content of lists of words (for other data derived
+        # from them, as n-grams models).
+        self.words_ids = {}
+        self.user_ids = {}
+        self._lookup = {}
+        self._index = {}
+        self.compounds = {}
         self.word_gen = word_gen
+        # Kind of words’ sets ("sets" or "sorted", see SortedWords).
+        self.words_index = WORDS_INDEX
 
     def preprocess(self, txt):
         """
         Applies text pre-processing, as explained in init() doc.
         Returns None in case the text should be discarded.
         """
-        if self.charmap and self.charset:
-            txt = "".join(c for c in txt \
-                            if c in self.charset).translate(self.charmap)
-        elif self.charset:
-            txt = "".join(c for c in txt if c in self.charset)
-        elif self.charmap:
-            txt = txt.translate(self.charmap)
-        if self.func:
-            txt = self.func(txt)
+        txt = self._normalize(txt)
         if not self.do_minmax_len or self.minlen <= len(txt) < self.maxlen:
             return txt
         # else return None.
 
-    def init(self, ids=None, charset=None, charmap=None, func=None,
-             minlen=None, maxlen=None):
+    def _normalize(self, txt):
         """
-        Inits this MatchDic object, by getting all words generated from set
-        generator for the given ids (or all, if None).
-        It will optionnaly apply to each generated word, before storing it:
-            * charset and charmap operations (i.e. removing all chars
-              not in charset, and then calling str.translate with charmap).
-            * If func is not None, it must be a callable taking one str arg,
-              and returning an str (can be e.g. str.lower()...).
-            * length operation (i.e. rejecting words smaller than minlen
-              (defaults to 1) or longer than maxlen (defaults to 32767).
+        Applies text pre-processing, without length checks.
+        """
+        if self._table is not None:
+            txt = txt.translate(self._table)
+        if self.func:
+            txt = self.func(txt)
+        return txt
+
+    def _finalize(self, chunks):
+        """
+        Applies func and length checks to already translated chunks,
+        yielding them (or None for discarded ones).
+        """
+        func = self.func
+        minlen, maxlen = self.minlen, self.maxlen
+        for c in chunks:
+            if func:
+                c = func(c)
+            if not self.do_minmax_len or minlen <= len(c) < maxlen:
+                yield c
+            else:
+                yield None
+
+    def split_text(self, text, check_len=True):
+        """
+        Splits text on whitespaces and pre-processes its chunks (the whole
+        text is translated at once), yielding them (or None for discarded
+        ones, empty ones are skipped).
+        If check_len is False, chunks are never discarded for their length.
+        """
+        if self._text_table is not None:
+            text = text.translate(self._text_table)
+        if not check_len:
+            return map(self.func, text.split()) if self.func else text.split()
+        return self._finalize(text.split())
+
+    def preprocess_words(self, words, batch=10000):
+        """
+        Pre-processes given words (an iterable of words without any newline),
+        translating them by batches, yielding them (or None for discarded
+        ones).
+        """
+        words = iter(words)
+        while True:
+            lst = list(itertools.islice(words, batch))
+            if not lst:
+                break
+            if self._words_table is not None:
+                lst = "\n".join(lst).translate(self._words_table).split("\n")
+            yield from self._finalize(lst)
+
+    def set_params(self, charset=None, charmap=None, func=None,
+                   minlen=None, maxlen=None):
+        """
+        Sets the pre-processing parameters of this MatchDic object (see
+        init() doc), without generating any list of words.
         """
         if charset:
             self.charset = set(charset)
@@ -106,6 +424,21 @@ class MatchDic(object):
             self.charmap = str.maketrans(charmap)
         else:
             self.charmap = None
+        # Charset filtering and charmap translation are done in a single
+        # str.translate() call, with one of those tables.
+        if self.charset:
+            cmap = self.charmap or {}
+            table = {ord(c): cmap.get(ord(c), ord(c)) for c in self.charset}
+            strict = True
+        else:
+            table = self.charmap
+            strict = False
+        if table is None:
+            self._table = self._text_table = self._words_table = None
+        else:
+            self._table = TranslateTable(table, strict)
+            self._text_table = TranslateTable(table, strict, str.isspace)
+            self._words_table = TranslateTable(table, strict, "\n".__eq__)
         self.func = func
         if minlen or maxlen:
             if not minlen:
@@ -115,76 +448,273 @@ class MatchDic(object):
         self.minlen = minlen
         self.maxlen = maxlen
         self.do_minmax_len = bool(minlen or maxlen)
-        if DO_CACHE:
-            # XXX Eeek! func.__name__ is weak. :(
-            hsh_param = pickle.dumps((self.charset, self.charmap,
-                                      func.__name__ if func else None,
-                                      minlen, maxlen))
+        # XXX Eeek! func.__name__ is weak. :(
+        # Note: sets and dicts must be sorted, else their pickled form
+        #       changes between runs (hash randomization)!
+        self._hsh_param = pickle.dumps((sorted(self.charset or ()),
+                                        sorted((self.charmap or {}).items()),
+                                        func.__name__ if func else None,
+                                        minlen, maxlen))
+
+    def get_params_hash(self):
+        """
+        Returns an hex string identifying current pre-processing parameters
+        (and version of this code), e.g. to find matching precompiled lists
+        of words.
+        """
+        return cache.cache.hashbytes(self._hsh_param,
+                                     self._hash_salt).hexdigest()
+
+    def init(self, ids=None, charset=None, charmap=None, func=None,
+             minlen=None, maxlen=None, jobs=1):
+        """
+        Inits this MatchDic object, by getting all words generated from set
+        generator for the given ids (or all, if None).
+        It will optionnaly apply to each generated word, before storing it:
+            * charset and charmap operations (i.e. removing all chars
+              not in charset, and then calling str.translate with charmap).
+            * If func is not None, it must be a callable taking one str arg,
+              and returning an str (can be e.g. str.lower()...).
+            * length operation (i.e. rejecting words smaller than minlen
+              (defaults to 1) or longer than maxlen (defaults to 32767).
+        Lists of words not available from cache are built in parallel by up
+        to jobs worker processes (None for one per CPU).
+        """
+        self.set_params(charset, charmap, func, minlen, maxlen)
 
         if ids == None:
             ids = self.word_gen.ids
+        keys = {}
         for uid in ids:
             if DO_CACHE:
                 hsh = self.word_gen.get_hash(uid)
-                hsh.update(hsh_param)
+                hsh.update(self._hsh_param)
                 hsh.update(self._hash_salt)
-                hsh = hsh.hexdigest()
-                key = (CACHE_PREFIX, uid, hsh)
-                if key in cache.cache:
-                    self.ids[uid] = cache.cache[key]
-                    continue
-            utils.printf("Building {}’s list of words... ".format(uid), end="")
-            lst = self.ids[uid] = []
-            lst_ln = len(lst)
-            for w in (self.preprocess(w)
-                      for w in self.word_gen.gen_words(dics=(uid,))):
-                if not w:
-                    continue
-                ln = len(w)
-                if ln > lst_ln:
-                    lst += [set() for i in range(ln - lst_ln)]
-                    lst_ln = ln
-                lst[ln - 1].add(w)
-            if DO_CACHE:
-                cache.cache[key] = lst
+                if self.words_index == "sorted":
+                    hsh.update(b"sorted")
+                keys[uid] = (CACHE_PREFIX, uid, hsh.hexdigest())
+            else:
+                keys[uid] = None
+
+        pool = None
+        done = set()
+        if jobs != 1:
+            para = [uid for uid, key in keys.items()
+                    if not key or key not in cache.cache]
+            pool = utils.process_pool(jobs, len(para), _init_worker, (self,))
+        if pool:
+            utils.printf("Building {} lists of words in parallel... "
+                         "".format(len(para)), end="")
+            with pool:
+                futures = {uid: pool.submit(_build_words_worker, uid,
+                                            keys[uid])
+                           for uid in para}
+                for uid, f in futures.items():
+                    self.ids[uid] = f.result()
+                    done.add(uid)
             print("Done.")
+        for uid, key in keys.items():
+            if key:
+                self.words_ids[uid] = key[2]
+            else:
+                self.words_ids.pop(uid, None)
+            if uid in done:
+                continue
+            if key:
+                self.ids[uid] = cache.cache.get_or_build(
+                                    key, lambda: self._build_words(uid))
+            else:
+                self.ids[uid] = self._build_words(uid)
 
-    def get_match_level(self, uid, text):
+        if hasattr(self.word_gen, "get_compounds"):
+            for uid in keys:
+                self.set_compounds(uid, self.word_gen.get_compounds(uid))
+        for uid in keys:
+            self._update_lookup(uid)
+
+    def _get_gen_bounds(self):
         """
-        Returns a float value (in [0.0, 1.0]), the highest it is, the better
-        the given text match content (words) of the given uid's dic.
+        Returns the (minlen, maxlen) bounds generated words must respect to
+        possibly give, once pre-processed, a word within our own bounds
+        (None when nothing can be told).
+        """
+        if not self.do_minmax_len or self.func:
+            return None, None
+        # charmap may replace a char by several ones, or remove it, and
+        # charset filtering may only make words shorter.
+        vals = (self.charmap or {}).values()
+        expand = max((len(v) for v in vals if isinstance(v, str)), default=1)
+        minlen = -(-self.minlen // max(expand, 1))
+        maxlen = None
+        if not self.charset and None not in vals and "" not in vals:
+            maxlen = self.maxlen
+        return (minlen if minlen > 1 else None), maxlen
+
+    def _build_words(self, uid):
+        """
+        Builds the list of (per-length sets of) words for given uid.
+        """
+        utils.printf("Building {}’s list of words... ".format(uid), end="")
+        minlen, maxlen = self._get_gen_bounds()
+        if minlen or maxlen:
+            words = self.word_gen.gen_words(dics=(uid,), minlen=minlen,
+                                            maxlen=maxlen)
+        else:
+            words = self.word_gen.gen_words(dics=(uid,))
+        lst = self._bucket_words(words)
+        if self.words_index == "sorted":
+            lst = [SortedWords(s) for s in lst]
+        print("Done.")
+        return lst
+
+    def _bucket_words(self, words):
+        """
+        Pre-processes given words, and returns them as a list of per-length
+        sets.
         """
-        chunks = [self.preprocess(w) for w in text.split()]
-        scoria = []
-        brk = False
-        while chunks:
-            chk = chunks.pop(0)
-            if not chk:
+        lst = []
+        lst_ln = len(lst)
+        for w in self.preprocess_words(words):
+            if not w:
                 continue
-            # Check from longest words to shortest!
-            # However, no need to test words longer than chunk!
-            ln = len(chk)
-            width = min(ln - 1, len(self.ids[uid]) - 1)
-            # Simple obvious test!
-            if chk in self.ids[uid][width]:
+            ln = len(w)
+            if ln > lst_ln:
+                lst += [set() for i in range(ln - lst_ln)]
+                lst_ln = ln
+            lst[ln - 1].add(w)
+        return lst
+
+    def add_user_words(self, uid, path):
+        """
+        Adds words from given plain text file (utf-8, one word per line,
+        lines starting with '#' are ignored) to uid’s dic, as an overlay:
+        they are pre-processed and cached on their own (so changing them
+        never invalidates dic’s cached words), and only merged with dic’s
+        words at lookup time.
+        """
+        with open(path, "rb") as f:
+            data = f.read()
+
+        def _build():
+            utils.printf("Building user words from {}... ".format(path),
+                         end="")
+            words = (w.strip() for w in data.decode("utf-8-sig").split("\n"))
+            lst = self._bucket_words(w for w in words
+                                     if w and not w.startswith('#'))
+            print("Done.")
+            return lst
+
+        if DO_CACHE:
+            hsh = cache.cache.hashbytes(data, self._hash_salt)
+            hsh.update(self._hsh_param)
+            lst = cache.cache.get_or_build((CACHE_PREFIX, "user",
+                                            hsh.hexdigest()), _build)
+        else:
+            lst = _build()
+        user = self.user_ids.setdefault(uid, [])
+        # Never modify lists or sets got from cache!
+        for i, words in enumerate(lst):
+            if i >= len(user):
+                user.append(words)
+            elif words:
+                user[i] = user[i] | words
+        self._update_lookup(uid)
+
+    def _update_lookup(self, uid):
+        """
+        Updates the per-length sets of words actually used to check texts
+        against uid’s dic (i.e. its own words plus user ones, if any).
+        """
+        self._index.pop(uid, None)
+        user = self.user_ids.get(uid)
+        if not user:
+            self._lookup.pop(uid, None)
+            return
+        base = self.ids.get(uid, [])
+        lookup = []
+        for i in range(max(len(base), len(user))):
+            sets = [lst[i] for lst in (base, user) if i < len(lst) and lst[i]]
+            if len(sets) > 1:
+                lookup.append(WordsUnion(*sets))
+            else:
+                lookup.append(sets[0] if sets else set())
+        self._lookup[uid] = lookup
+
+    def _get_index(self, uid):
+        """
+        Returns the WordsIndex of uid’s dic (and user words), building it
+        on first use.
+        """
+        idx = self._index.get(uid)
+        if idx is None:
+            base = self.ids[uid]
+            user = self.user_ids.get(uid)
+            if user:
+                idx = WordsIndex(self._lookup[uid], base, user)
+            else:
+                idx = WordsIndex(base)
+            self._index[uid] = idx
+        return idx
+
+    def set_compounds(self, uid, compounds):
+        """
+        Sets compounding data of given uid, as a (rules, parts, minlen)
+        tuple (see Hunspell.get_compounds()), or None. Parts are
+        pre-processed like words.
+        """
+        if not compounds:
+            self.compounds.pop(uid, None)
+            return
+        rules, parts, minlen = compounds
+        parts = {f: {p for p in (self._normalize(w) for w in words
+                                 if len(w) >= minlen) if p}
+                 for f, words in parts.items()}
+        matcher = CompoundMatcher(rules, parts)
+        if matcher.rules:
+            self.compounds[uid] = matcher
+        else:
+            self.compounds.pop(uid, None)
+
+    def _get_scoria(self, uid, chk):
+        """
+        Returns the number of chars of given (pre-processed) chunk that do
+        not belong to any word of uid’s dic (nor to a valid compound).
+        """
+        # All words found in chunk, longest first.
+        matches = self._get_index(uid).find(chk)
+        compound = self.compounds.get(uid)
+        scoria = 0
+        # Greedily keep the longest (and then leftmost) word of each
+        # segment of the chunk, and search again both remaining parts.
+        segs = [(0, len(chk))]
+        while segs:
+            start, end = segs.pop()
+            if start == end:
                 continue
-            # Else, for each possible word length, use a sliding window
-            # over the chunk to search for a matching word (starting from
-            # longest ones).
-            for wlst in reversed(self.ids[uid][:width]):
-                for i in range(0, ln - width):
-                    if chk[i:i + width] in wlst:
-                        chunks += (chk[:i], chk[i + width:])
-                        brk = True
-                        break
-                if brk:
+            for ln, i in matches:
+                if start <= i and i + ln <= end:
                     break
-                width -= 1
-            if not brk:  # No match where found for this chunk.
-                scoria.append(chk)
             else:
-                brk = False
-        return (len(text) - len("".join(scoria))) / len(text)
+                ln = i = None
+            if ln == end - start:  # Simple obvious case!
+                continue
+            # Valid compound word?
+            if compound and compound.match(chk[start:end]):
+                continue
+            if ln is None:  # No match where found for this segment.
+                scoria += end - start
+            else:
+                segs += ((start, i), (i + ln, end))
+        return scoria
+
+    def get_match_level(self, uid, text):
+        """
+        Returns a float value (in [0.0, 1.0]), the highest it is, the better
+        the given text match content (words) of the given uid's dic.
+        """
+        scoria = sum(self._get_scoria(uid, chk)
+                     for chk in self.split_text(text) if chk)
+        return (len(text) - scoria) / len(text)
 
     def find_best_dic(self, text, ):
         """
@@ -193,7 +723,141 @@ class MatchDic(object):
         Note: For performance reasons, you should feed it with small chunks of
               text – usually, 50 to 100 chars are enough!
         """
-        res = {}
-        for uid in self.ids.keys():
-            res[uid] = self.get_match_level(uid, text)
-        return res
+        return self.score_many((text,))[0]
+
+    def score_many(self, texts, ids=None, jobs=1, minimum=None,
+                   best_only=False):
+        """
+        Returns a list of dicts {uid: value}, the matching values of each of
+        given texts against given dics (all loaded ones if None), just like
+        find_best_dic() would do, but sharing texts’ pre-processing between
+        dics, and results of repeated chunks (brute-force candidates often
+        share many of them).
+        If minimum is given (or best_only is True), scoring a text against a
+        dic stops as soon as its value cannot reach minimum (or the best
+        value already found for that text): the value given for that dic is
+        then only an upper bound of the real one, lower than minimum (or
+        than the best one – so the best dic and its value are always exact).
+        Texts are scored by up to jobs worker processes (None for one per
+        CPU).
+        """
+        texts = list(texts)
+        if ids is None:
+            ids = list(self.ids)
+        ntasks = (len(texts) + SCORE_BATCH - 1) // SCORE_BATCH
+        pool = None
+        if jobs != 1 and ntasks > 1:
+            for uid in ids:
+                self._get_index(uid)  # Build them once, before forking.
+            pool = utils.process_pool(jobs, ntasks, _init_worker, (self,))
+        if pool:
+            with pool:
+                futures = [pool.submit(_score_many_worker,
+                                       texts[i:i + SCORE_BATCH], ids,
+                                       minimum, best_only)
+                           for i in range(0, len(texts), SCORE_BATCH)]
+                return [r for f in futures for r in f.result()]
+
+        memo = {uid: {} for uid in ids}
+        # Dics are tried from the last best one, likely to be the best one
+        # again for next text (which gives tighter bounds).
+        order = list(ids)
+        ret = []
+        for text in texts:
+            chunks = [c for c in self.split_text(text) if c]
+            ln = len(text)
+            res = {}
+            best = None
+            for uid in order:
+                floor = minimum
+                if best_only and best is not None and (floor is None or
+                                                       best > floor):
+                    floor = best
+                m = memo[uid]
+                scoria = 0
+                for chk in chunks:
+                    sc = m.get(chk)
+                    if sc is None:
+                        sc = m[chk] = self._get_scoria(uid, chk)
+                    scoria += sc
+                    # Even if all remaining chars matched...
+                    if floor is not None and (ln - scoria) / ln < floor:
+                        break
+                res[uid] = (ln - scoria) / ln
+                if best is None or res[uid] > best:
+                    best = res[uid]
+                    best_uid = uid
+            if best_only and best is not None and order[0] != best_uid:
+                order.remove(best_uid)
+                order.insert(0, best_uid)
+            ret.append({uid: res[uid] for uid in ids})
+        return ret
+
+    def probe_many(self, texts, slice_len=50, slice_nbr=3, ref_len=None,
+                   minimum=None, jobs=1):
+        """
+        Returns a list of (uid, value) tuples, the best matching dic of each
+        of given texts, and their average matching value over (at most)
+        slice_nbr probes of slice_len chars, the first one determining the
+        language (that’s how brute-force hackers rank their candidates).
+        Probes are spread over each text, or over its ref_len first chars if
+        given.
+        If minimum is given, other probes of texts which cannot reach it
+        (even if all of them fully matched) are not scored, their value is
+        then only an upper bound (lower than minimum).
+        """
+        texts = list(texts)
+        probes = []
+        for text in texts:
+            ln = len(text) if ref_len is None else ref_len
+            nbr = max(1, min(slice_nbr, (ln + slice_len - 1) // slice_len))
+            step = max((ln - slice_len) // nbr, 1)
+            probes.append((nbr, range(step, nbr * step, step)))
+        # The first probe determines the language (only the best one is
+        # needed)!
+        firsts = self.score_many((t[:slice_len] for t in texts), jobs=jobs,
+                                 best_only=True)
+        langs = [max(r, key=lambda k: r[k]) for r in firsts]
+        sums = [r[lng] for r, lng in zip(firsts, langs)]
+        # Then, other probes of each language are scored together.
+        others = {}
+        for n, (text, lng) in enumerate(zip(texts, langs)):
+            nbr, prb = probes[n]
+            if minimum is not None and (sums[n] + len(prb)) / nbr < minimum:
+                sums[n] += len(prb)  # Clearly failing, don’t go further.
+                continue
+            others.setdefault(lng, []).extend((n, text[i:i + slice_len])
+                                              for i in prb)
+        for lng, lst in others.items():
+            res = self.score_many((t for n, t in lst), (lng,), jobs)
+            for (n, t), r in zip(lst, res):
+                sums[n] += r[lng]
+        return [(lng, sm / nbr)
+                for lng, sm, (nbr, prb) in zip(langs, sums, probes)]
+
+
+# Process pool workers' helpers (see MatchDic.init()).
+_worker_matchdic = None
+
+
+def _init_worker(matchdic):
+    global _worker_matchdic
+    _worker_matchdic = matchdic
+
+
+def _build_words_worker(uid, key):
+    """
+    Returns the list of (per-length sets of) words of given uid, also
+    storing it in cache under key (if not None).
+    """
+    m = _worker_matchdic
+    if not key:
+        return m._build_words(uid)
+    words = cache.cache.get_or_build(key, lambda: m._build_words(uid))
+    # Our own exit handlers are not called in workers!
+    cache.cache.flush()
+    return words
+
+
+def _score_many_worker(texts, ids, minimum, best_only):
+    return _worker_matchdic.score_many(texts, ids, 1, minimum, best_only)
@@ -0,0 +1,210 @@
+########################################################################
+#                                                                      #
+#   Cyprium is a multifunction cryptographic, steganographic and       #
+#   cryptanalysis tool developped by members of The Hackademy.         #
+#   French White Hat Hackers Community!                                #
+#   cyprium.hackademics.fr                                             #                                                  #
+#   Authors: SAKAROV, mont29, afranck64                                #
+#   Contact: admin@hackademics.fr                                      #
+#   Forum: hackademics.fr                                              #
+#   Twitter: @hackademics_                                             #
+#                                                                      #
+#   Cyprium is free software: you can redistribute it and/or modify    #
+#   it under the terms of the GNU General Public License as published  #
+#   by the Free Software Foundation, either version 3 of the License,  #
+#   or any later version.                                              #
+#                                                                      #
+#   This program is distributed in the hope that it will be useful,    #
+#   but without any warranty; without even the implied warranty of     #
+#   merchantability or fitness for a particular purpose. See the       #
+#   GNU General Public License for more details.                       #
+#                                                                      #
+#   The terms of the GNU General Public License is detailed in the     #
+#   COPYING attached file. If not, see : http://www.gnu.org/licenses   #
+#                                                                      #
+########################################################################
+
+
+import math
+import array
+import itertools
+import collections
+
+import settings
+import kernel.cache as cache
+import kernel.utils as utils
+
+
+DO_CACHE = settings.CCH_USE
+CACHE_PREFIX = "ngrams"
+KEEP_RATIO = settings.DICS_NGRAMS_KEEP_RATIO
+KEEP_MIN = settings.DICS_NGRAMS_KEEP_MIN
+
+# Size of grams.
+N = 3
+
+# Additive smoothing of grams’ counts.
+ALPHA = 0.5
+
+
+class NGramModel(object):
+    """
+    A letters n-grams statistical model of a language, trained from its
+    (pre-processed) words, giving a cheap (though rough) likelihood of some
+    text being written in that language.
+    Words are padded with n - 1 spaces, so that grams also model words’
+    starts and ends.
+    """
+
+    # Used to ensure cached data was cached with same version.
+    # Change that when modifying training code!
+    _hash_salt = b"1.0.0"
+
+    __slots__ = ("n", "logp", "floor", "baseline")
+
+    def __init__(self, n, grams, logps, floor, baseline):
+        """
+        grams is a str of all (concatenated) known grams, logps an array of
+        their log-probabilities, floor the one of unknown grams, and
+        baseline the average log-probability of grams of training words.
+        """
+        self.n = n
+        self.logp = {grams[i:i + n]: lp
+                     for i, lp in zip(range(0, len(grams), n), logps)}
+        self.floor = floor
+        self.baseline = baseline
+
+    def to_data(self):
+        """
+        Returns the (n, grams, logps, floor, baseline) compact data of that
+        model (see __init__()).
+        """
+        return (self.n, "".join(self.logp),
+                array.array('f', self.logp.values()), self.floor,
+                self.baseline)
+
+    @classmethod
+    def train(cls, words, n=N, alpha=ALPHA):
+        """
+        Returns the compact data (see to_data()) of a model trained from
+        words (an iterable of sets of words, as MatchDic’s lists).
+        """
+        pad = " " * (n - 1)
+        txt = pad + pad.join(itertools.chain.from_iterable(words)) + pad
+        counts = collections.Counter(map("".join,
+                                         zip(*(txt[i:] for i in range(n)))))
+        counts.pop(" " * n, None)  # Empty lists of words only.
+        total = sum(counts.values())
+        # Maximal number of distinct grams (plus one for padding char).
+        nchars = len(set(txt) | {" "})
+        denom = math.log(total + alpha * (nchars ** n))
+        floor = math.log(alpha) - denom
+        grams = "".join(counts)
+        logps = array.array('f', (math.log(c + alpha) - denom
+                                  for c in counts.values()))
+        if total:
+            baseline = sum(c * lp for c, lp in zip(counts.values(),
+                                                   logps)) / total
+        else:
+            baseline = floor
+        return (n, grams, logps, floor, baseline)
+
+    def score(self, chunks):
+        """
+        Returns the average log-probability of grams of given (pre-processed)
+        chunks of text, relative to the one of training words (so that
+        scores of different models can be compared): around 0.0 for a text
+        of that language, the lower the less likely.
+        """
+        pad = " " * (self.n - 1)
+        txt = pad + pad.join(chunks) + pad
+        nbr = len(txt) - self.n + 1
+        if nbr < 1 or not chunks:
+            return self.floor - self.baseline
+        grams = map("".join, zip(*(txt[i:] for i in range(self.n))))
+        return (sum(map(self.logp.get, grams, itertools.repeat(self.floor))) /
+                nbr - self.baseline)
+
+
+# Models already loaded, by cache key (or (uid, id(MatchDic)) if no cache).
+_models = {}
+
+
+def get_models(matchdic, ids=None, n=N):
+    """
+    Returns a dict {uid: NGramModel} for given dics (all loaded ones if
+    None) of given MatchDic object, trained from their words (user ones
+    excluded), getting them from cache when possible.
+    """
+    ret = {}
+    for uid in (matchdic.ids if ids is None else ids):
+        words_id = matchdic.words_ids.get(uid)
+        if words_id and DO_CACHE:
+            key = (CACHE_PREFIX, uid,
+                   cache.cache.hashbytes((words_id + str(n)).encode("ascii"),
+                                         NGramModel._hash_salt).hexdigest())
+        else:
+            key = (uid, id(matchdic.ids[uid]), n)
+        model = _models.get(key)
+        if model is None:
+            def _build():
+                utils.printf("Building {}’s n-grams model... ".format(uid),
+                             end="")
+                data = NGramModel.train(matchdic.ids[uid], n)
+                print("Done.")
+                return data
+            if words_id and DO_CACHE:
+                data = cache.cache.get_or_build(key, _build)
+            else:
+                data = _build()
+            model = _models[key] = NGramModel(*data)
+        ret[uid] = model
+    return ret
+
+
+def best_many(matchdic, texts, models=None):
+    """
+    Returns a list of (uid, score) tuples, the best n-grams model of each of
+    given texts, among given models (or those of all loaded dics of
+    matchdic), and its score (see NGramModel.score()), texts being
+    pre-processed by matchdic.
+    """
+    if models is None:
+        models = get_models(matchdic)
+    models = list(models.items())
+    ret = []
+    for text in texts:
+        chunks = [c for c in matchdic.split_text(text, check_len=False) if c]
+        ret.append(max(((uid, m.score(chunks)) for uid, m in models),
+                       key=lambda r: r[1]))
+    return ret
+
+
+def score_many(matchdic, texts, models=None):
+    """
+    Returns a list of the best n-grams scores (see best_many()) of each of
+    given texts.
+    """
+    return [sc for uid, sc in best_many(matchdic, texts, models)]
+
+
+def prefilter(matchdic, texts, ratio=KEEP_RATIO, minimum=KEEP_MIN,
+              models=None):
+    """
+    Returns the (sorted) indices of the most promising given texts (at least
+    minimum ones, or a ratio of them), according to their n-grams scores,
+    so that only those are checked against (much more expensive) dics, and
+    a list of (index, uid) tuples of the rejected ones, from the most
+    promising one, uid being the language of their best n-grams model.
+    If ratio is None, all texts are kept.
+    """
+    texts = list(texts)
+    if ratio is None:
+        return list(range(len(texts))), []
+    keep = max(minimum, int(len(texts) * ratio + 0.5))
+    if keep >= len(texts):
+        return list(range(len(texts))), []
+    bests = best_many(matchdic, texts, models)
+    order = sorted(range(len(texts)), key=lambda i: bests[i][1],
+                   reverse=True)
+    return sorted(order[:keep]), [(i, bests[i][0]) for i in order[keep:]]
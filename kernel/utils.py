@@ -26,6 +26,7 @@
 
 
 import sys
+import os
 import itertools
 import time
 import string
@@ -103,6 +104,39 @@ def printf(*args, **kwargs):
         sys.stdout.flush()
 
 
+def _init_pool_worker(initializer, initargs):
+    """
+    Mutes stdout of a process pool worker, and calls its real initializer.
+    """
+    sys.stdout = open(os.devnull, "w")
+    if initializer:
+        initializer(*initargs)
+
+
+def process_pool(jobs, ntasks, initializer=None, initargs=()):
+    """
+    Returns a ProcessPoolExecutor to run ntasks tasks, with at most jobs
+    workers (one per CPU if None), or None if there is no point using more
+    than one process.
+    Workers' stdout is muted, so that their progress messages do not get
+    mixed up. When available, workers are forked (so that initargs, which
+    may be big, do not have to be pickled).
+    """
+    import concurrent.futures
+    import multiprocessing
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    jobs = min(jobs, ntasks)
+    if jobs < 2:
+        return None
+    ctx = None
+    if "fork" in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context("fork")
+    return concurrent.futures.ProcessPoolExecutor(
+                jobs, mp_context=ctx, initializer=_init_pool_worker,
+                initargs=(initializer, initargs))
+
+
 ###############################################################################
 # Bases ops.
 ###############################################################################
@@ -40,6 +40,40 @@ ROOT_DIR = os.path.dirname(__file__)
 # The path for zip archive containing language dics to use.
 HUNSPELL_ZIP_DICS = os.path.join(ROOT_DIR, "kernel", "dics.zip")
 
+# Trust dics' fingerprints (zip CRC, size and archive modification time) to
+# find their hashes in cache, instead of decompressing and hashing them at
+# each start.
+HUNSPELL_FINGERPRINTS = True
+
+# The path of precompiled dics bundle (final lists of words, as used by
+# MatchDic), built with "python -m kernel.dicbundle build".
+# It is only used if it is up to date with HUNSPELL_ZIP_DICS.
+DICS_BUNDLE = os.path.join(ROOT_DIR, "kernel", "dics.bundle")
+DICS_USE_BUNDLE = True
+
+# User words, added to some dics as overlays (e.g. jargon, names...), as a
+# dict {dic_id: paths}, paths being a single path, or a list, tuple or set
+# of paths (None as dic_id adds them to all dics). Each file is a plain
+# utf-8 text, with one word per line ('#' starting comment lines).
+DICS_USER = {}
+
+# Number of processes used to parse/expand dics (each dic is processed in
+# its own worker), None for one per CPU, 1 to disable parallel processing.
+DICS_JOBS = None
+
+# How MatchDic stores its lists of words in memory (and cache):
+# * "sets": sets of str, the quickest to look up.
+# * "sorted": compact sorted buffers of encoded words (binary searched), about
+#   ten times lighter, but slower to look up.
+DICS_WORDS_INDEX = "sets"
+
+# Brute-force hackers first rank their candidates with cheap letters n-grams
+# models of languages, and only check the most promising ones against dics:
+# DICS_NGRAMS_KEEP_RATIO of them, but at least DICS_NGRAMS_KEEP_MIN ones.
+# None as ratio disables that pre-filtering.
+DICS_NGRAMS_KEEP_RATIO = 0.05
+DICS_NGRAMS_KEEP_MIN = 20
+
 
 ## Cache settings.
 
@@ -52,9 +86,36 @@ CCH_USE = True
 # Where to store cache files.
 CCH_BASE_DIR = os.path.join(ROOT_DIR, ".cache")
 
+# Storage backend of the cache:
+# * "files": one pickle file per cached object, in a dir tree mirroring keys.
+# * "mmap": a single append-only data file (memory-mapped) and a small index,
+#   much quicker to open when there are many cached objects.
+CCH_BACKEND = "files"
+
 # Maximum size of cache, in Mo.
 CCH_MAX_SIZE = 256
 
+# Low-water mark of cache, as a fraction of CCH_MAX_SIZE: once cache grows over
+# its maximum size, least-recently-used objects are removed until it is back
+# under that mark (so that a burst of writes does not trigger a removal each
+# time).
+CCH_LOW_WATER = 0.75
+
+# Maximum size of the in-memory part of the cache, in Mo (recently used
+# objects are kept deserialized in memory, as long as the process lives).
+# Sizes are approximated from uncompressed serialized ones (plus a per-word
+# overhead for sets of words). 0 disables it.
+CCH_MEM_MAX_SIZE = 64
+
+# Compression of cached objects ("zlib", "lzma", or None to disable it), only
+# used for objects bigger than CCH_COMPRESS_MIN_SIZE (in Ko).
+CCH_COMPRESS = "zlib"
+CCH_COMPRESS_MIN_SIZE = 64
+
+# When several processes share a same cache dir, only let one of them build
+# a missing cached object, others wait for it and then read it from cache.
+CCH_SINGLE_FLIGHT = True
+
 # Hash algo to use as cache id.
 CCH_HASH_TYPE = "sha512"
 
@@ -0,0 +1,203 @@
+########################################################################
+#                                                                      #
+#   Cyprium is a multifunction cryptographic, steganographic and       #
+#   cryptanalysis tool developped by members of The Hackademy.         #
+#   French White Hat Hackers Community!                                #
+#   cyprium.hackademics.fr                                             #                                                  #
+#   Authors: SAKAROV, mont29, afranck64                                #
+#   Contact: admin@hackademics.fr                                      #
+#   Forum: hackademics.fr                                              #
+#   Twitter: @hackademics_                                             #
+#                                                                      #
+#   Cyprium is free software: you can redistribute it and/or modify    #
+#   it under the terms of the GNU General Public License as published  #
+#   by the Free Software Foundation, either version 3 of the License,  #
+#   or any later version.                                              #
+#                                                                      #
+#   This program is distributed in the hope that it will be useful,    #
+#   but without any warranty; without even the implied warranty of     #
+#   merchantability or fitness for a particular purpose. See the       #
+#   GNU General Public License for more details.                       #
+#                                                                      #
+#   The terms of the GNU General Public License is detailed in the     #
+#   COPYING attached file. If not, see : http://www.gnu.org/licenses   #
+#                                                                      #
+########################################################################
+
+
+import os
+import sys
+import struct
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+
+import kernel.cache as cache
+
+
+class TestWordSetsCodecs(unittest.TestCase):
+
+    SETS = [set(), {""}, {"", "a"}, {"abc", "abd", "é"}, set()]
+
+    def test_roundtrip(self):
+        for name in ("wordsets", "wordsets_fc"):
+            chunks = cache.encode(self.SETS, name, False)
+            self.assertEqual(cache.decode(b"".join(chunks)), self.SETS, name)
+
+    def test_empty_word_only(self):
+        for name in ("wordsets", "wordsets_fc"):
+            for data in ([{""}], [set()], [{""}, set(), {""}]):
+                chunks = cache.encode(data, name, False)
+                self.assertEqual(cache.decode(b"".join(chunks)), data, name)
+
+
+class TestCompressions(unittest.TestCase):
+
+    DATA = [{"word{:05}".format(i) for i in range(5000)}]
+
+    def test_roundtrip(self):
+        for name in cache.COMPRESSIONS:
+            chunks = cache.encode(self.DATA, None, name)
+            self.assertEqual(cache.get_compression(chunks[0]), name)
+            self.assertEqual(cache.decode(b"".join(chunks)), self.DATA)
+
+    def test_corrupted(self):
+        for name in cache.COMPRESSIONS:
+            buf = b"".join(cache.encode(self.DATA, None, name))
+            hlen = len(cache.COMPRESS_MAGIC)
+            uid, size = struct.unpack_from("<BQ", buf, hlen)
+            bad_size = buf[:hlen + 1] + struct.pack("<Q", size + 1) + \
+                       buf[hlen + 9:]
+            for b in (buf[:-10], buf[:len(buf) // 2], bad_size,
+                      buf[:hlen + 9] + bytes(len(buf) - hlen - 9)):
+                with self.assertRaises(cache.CorruptedDataError, msg=name):
+                    cache.decompress(b)
+
+
+class TestDiskCache(unittest.TestCase):
+
+    backend = cache.DiskCache
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix="cyprium-test-")
+        self.cache = self.backend(self.dir)
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_key_locks(self):
+        for i in range(self.backend.KEYLOCKS_STRIPES * 2):
+            self.cache.get_or_build(("test", str(i)), lambda: [{str(i)}])
+        locks = os.listdir(os.path.join(self.dir, self.backend.KEYLOCKS_DIR))
+        self.assertLessEqual(len(locks), self.backend.KEYLOCKS_STRIPES)
+
+    def test_clear(self):
+        for i in range(10):
+            self.cache.get_or_build(("test", str(i)), lambda: [{str(i)}])
+        self.assertIn(("test", "3"), self.cache)
+        self.cache.clear()
+        self.assertNotIn(("test", "3"), self.cache)
+        self.assertFalse(os.path.exists(
+                            os.path.join(self.dir,
+                                         self.backend.KEYLOCKS_DIR)))
+        self.cache.set(("test", "3"), [{"a"}])
+        self.assertEqual(self.cache[("test", "3")], [{"a"}])
+
+    # Whether each write saves the index.
+    flush_writes = False
+
+    def test_pending_writes(self):
+        sig = self.cache._get_index_sig()
+        self.cache.set(("test", "a"), [{"a"}])
+        self.assertEqual(self.cache._get_index_sig() != sig,
+                         self.flush_writes)
+        # Another process updating the index meanwhile.
+        other = self.backend(self.dir)
+        other.get_or_build(("test", "b"), lambda: [{"b"}])
+        self.assertIn(("test", "b"), self.cache)
+        self.assertIn(("test", "a"), self.cache)
+        self.cache.flush()
+        other.close()
+        other = self.backend(self.dir)
+        self.assertEqual(other[("test", "a")], [{"a"}])
+        self.assertEqual(other[("test", "b")], [{"b"}])
+        other.close()
+
+    def test_hits_no_sync(self):
+        key = ("test", "a")
+        self.cache.set(key, [{"a"}])
+        self.cache.memory.clear()
+        self.assertEqual(self.cache[key], [{"a"}])
+        self.cache.memory.clear()
+        with unittest.mock.patch.object(self.cache, "_sync") as sync:
+            self.assertIn(key, self.cache)
+            self.assertEqual(self.cache[key], [{"a"}])
+            sync.assert_not_called()
+            self.assertNotIn(("test", "b"), self.cache)
+            sync.assert_called()
+
+    def _damage(self, key):
+        with open(self.cache.key2path(key, self.dir), "r+b") as f:
+            f.truncate(os.path.getsize(f.name) - 10)
+
+    def test_corrupted_data(self):
+        key = ("test", "a")
+        self.cache.set(key, TestCompressions.DATA, compression="zlib")
+        self.cache.memory.clear()
+        self._damage(key)
+        with self.assertRaises(KeyError):
+            self.cache[key]
+        self.assertNotIn(key, self.cache)
+        self.cache.set(key, [{"a"}])
+        self.assertEqual(self.cache[key], [{"a"}])
+
+    def test_memory_cap_compressed(self):
+        max_size = 1024 * 1024
+        self.cache.memory = cache.MemoryCache(max_size)
+        with unittest.mock.patch.object(cache, "CCH_COMPRESS", "zlib"), \
+             unittest.mock.patch.object(cache, "CCH_COMPRESS_MIN_SIZE", 0):
+            for i in range(10):
+                # Highly compressible words.
+                data = [{"{}word{:06}".format(i, j) for j in range(5000)}]
+                self.cache.set(("test", str(i)), data)
+                self.assertEqual(self.cache._compressed[("test", str(i))],
+                                 "zlib")
+            self.cache.memory.clear()
+            for i in range(10):
+                self.cache[("test", str(i))]
+        mem = self.cache.memory
+        self.assertTrue(len(mem))
+        self.assertLessEqual(mem.size, max_size)
+        # Real memory footprint of kept objects must honor the cap too.
+        real = sum(sys.getsizeof(s) + sum(map(sys.getsizeof, s))
+                   for obj, sz, cost in mem._objs.values() for s in obj)
+        self.assertLessEqual(real, max_size)
+
+
+class TestMMapDiskCache(TestDiskCache):
+
+    backend = cache.MMapDiskCache
+    flush_writes = True
+
+    def _damage(self, key):
+        self.cache._unmap()
+        key = self.cache.norm_key(key)
+        end = self.cache._offsets[key] + self.cache._lru[key]
+        with open(self.cache.data_path, "r+b") as f:
+            f.seek(end - 10)
+            f.write(bytes(10))
+
+    def test_truncated_data(self):
+        self.cache.set(("test", "a"), [{"a"}])
+        self.cache.memory.clear()
+        self.cache._unmap()
+        with open(self.cache.data_path, "wb"):
+            pass
+        with self.assertRaises(KeyError):
+            self.cache[("test", "a")]
+
+
+if __name__ == "__main__":
+    unittest.main()
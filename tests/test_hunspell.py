@@ -0,0 +1,238 @@
+########################################################################
+#                                                                      #
+#   Cyprium is a multifunction cryptographic, steganographic and       #
+#   cryptanalysis tool developped by members of The Hackademy.         #
+#   French White Hat Hackers Community!                                #
+#   cyprium.hackademics.fr                                             #                                                  #
+#   Authors: SAKAROV, mont29, afranck64                                #
+#   Contact: admin@hackademics.fr                                      #
+#   Forum: hackademics.fr                                              #
+#   Twitter: @hackademics_                                             #
+#                                                                      #
+#   Cyprium is free software: you can redistribute it and/or modify    #
+#   it under the terms of the GNU General Public License as published  #
+#   by the Free Software Foundation, either version 3 of the License,  #
+#   or any later version.                                              #
+#                                                                      #
+#   This program is distributed in the hope that it will be useful,    #
+#   but without any warranty; without even the implied warranty of     #
+#   merchantability or fitness for a particular purpose. See the       #
+#   GNU General Public License for more details.                       #
+#                                                                      #
+#   The terms of the GNU General Public License is detailed in the     #
+#   COPYING attached file. If not, see : http://www.gnu.org/licenses   #
+#                                                                      #
+########################################################################
+
+
+import json
+import os
+import pickle
+import re
+import shutil
+import tempfile
+import unittest
+
+import kernel.cache as cache
+import kernel.hunspell as hunspell
+import kernel.matchdic as matchdic
+
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+
+class TestBaseWords(unittest.TestCase):
+
+    WORDS = [("chat", ("A", "B")), ("", ()), ("été", ("A", "B")),
+             ("ô", ("C",))]
+
+    def _build(self, words):
+        combos = sorted({c for w, c in words})
+        return hunspell.BaseWords((w for w, c in words),
+                                  (combos.index(c) for w, c in words),
+                                  combos)
+
+    def test_generators(self):
+        bw = self._build(self.WORDS)
+        self.assertEqual(len(bw), len(self.WORDS))
+        for i in range(2):
+            self.assertEqual(list(bw), self.WORDS)
+            self.assertEqual(len(bw), len(self.WORDS))
+            self.assertIn(("été", ("A", "B")), bw)
+            self.assertNotIn(("été", ("C",)), bw)
+
+    def test_empty(self):
+        bw = self._build([])
+        self.assertEqual(len(bw), 0)
+        self.assertEqual(list(bw), [])
+
+    def test_pickle(self):
+        bw = pickle.loads(pickle.dumps(self._build(self.WORDS)))
+        self.assertEqual(list(bw), self.WORDS)
+
+
+class _DicTestCase(unittest.TestCase):
+    """
+    Loads the tests/data/<NAME>.aff/.dic fixture, with a temporary cache.
+    """
+
+    NAME = None
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix="cyprium-test-")
+        self.cache = cache.DiskCache(os.path.join(self.dir, "cache"))
+        self.prev = cache.cache.swap(self.cache)
+        self.h = hunspell.Hunspell()
+        self.h.load_dic_file(os.path.join(DATA_DIR, self.NAME + ".dic"),
+                             os.path.join(DATA_DIR, self.NAME + ".aff"),
+                             self.NAME)
+        self.dic = self.h.dics[self.NAME]
+
+    def tearDown(self):
+        cache.cache.swap(self.prev)
+        self.cache.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+class TestCompounds(_DicTestCase):
+
+    NAME = "compound"
+
+    # compound.aff: COMPOUNDRULE ab*c, plus COMPOUNDFLAG X; “zing” is an
+    # ONLYINCOMPOUND c part.
+    VALID = ("footroom", "football", "footballroom", "footballballzing",
+             "footzing", "sunshine", "shinesunsun")
+    INVALID = ("foot", "ball", "zing", "sun", "ballfoot", "footfoot",
+               "roomfoot", "sunfoot", "footballs", "")
+
+    def _check(self, cm):
+        for w in self.VALID:
+            self.assertTrue(cm.match(w), w)
+        for w in self.INVALID:
+            self.assertFalse(cm.match(w), w)
+
+    def test_parse(self):
+        self.assertEqual(set(self.h.gen_words()),
+                         {"foot", "ball", "room", "sun", "shine"})
+        rules, parts, minlen = self.h.get_compounds(self.NAME)
+        self.assertEqual(minlen, 2)
+        self.assertEqual(len(rules), 2)
+        self.assertEqual(parts["c"], {"ball", "room", "zing"})
+        self.assertEqual(parts["X"], {"sun", "shine"})
+
+    def test_match(self):
+        rules, parts, minlen = self.h.get_compounds(self.NAME)
+        self._check(matchdic.CompoundMatcher(rules, parts))
+
+    def test_only_in_compound(self):
+        m = matchdic.MatchDic(self.h)
+        m.init([self.NAME], func=str.lower)
+        self.assertEqual(m.get_match_level(self.NAME, "zing"), 0.0)
+        self.assertEqual(m.get_match_level(self.NAME, "footzing"), 1.0)
+        self.assertEqual(m.get_match_level(self.NAME, "ball"), 1.0)
+
+    def test_to_data(self):
+        rules, parts, minlen = self.h.get_compounds(self.NAME)
+        data = matchdic.CompoundMatcher(rules, parts).to_data()
+        self._check(matchdic.CompoundMatcher(*data))
+        data = json.loads(json.dumps(data))
+        self._check(matchdic.CompoundMatcher(*data))
+
+
+class TestAffixIndex(_DicTestCase):
+
+    NAME = "affixes"
+    WORDS = ("", "y", "s", "fly", "day", "box", "church", "bach", "careful",
+             "ful", "abc", "axc", "ac", "acc", "été", "té", "thé", "café",
+             "é", "épée", "éase", "éloge", "pick", "run", "legal", "lég",
+             "lg", "extraordinarily", "xtraordinarily")
+
+    def _brute(self, c, word):
+        """
+        Applies all rules of class c to word, one by one.
+        """
+        sfx = c["sfx"]
+        for r in c["rules"]:
+            cond = r["if"] or ()
+            n = len(cond)
+            if n > len(word):
+                continue
+            part = word[len(word) - n:] if sfx else word[:n]
+            if not re.fullmatch("".join(cond), part):
+                continue
+            strip = len(r["strip"])
+            add = r["add"][0]
+            if sfx:
+                yield (word[:-strip] if strip else word) + add, r
+            else:
+                yield add + word[strip:], r
+
+    def test_index(self):
+        for name, c in self.dic["af_classes"].items():
+            used = set()
+            for w in self.WORDS:
+                brute = list(self._brute(c, w))
+                used |= {id(r) for _w, r in brute}
+                self.assertEqual(
+                        sorted(self.h.apply_class(self.dic, w, name)),
+                        sorted(_w for _w, r in brute), (name, w))
+            # Make sure the fixture does exercise all rules.
+            self.assertEqual(used, {id(r) for r in c["rules"]})
+
+    def test_conditions(self):
+        S = lambda w: set(self.h.apply_class(self.dic, w, "S"))
+        U = lambda w: set(self.h.apply_class(self.dic, w, "U"))
+        self.assertEqual(S("fly"), {"flys", "flies"})
+        self.assertEqual(S("day"), {"days"})
+        self.assertEqual(S("y"), {"ys"})
+        self.assertEqual(S("abc"), {"abcs", "abcer"})
+        self.assertEqual(S("ac"), {"acs"})
+        self.assertEqual(S("té"), {"tés"})
+        self.assertEqual(S("thé"), {"thés", "thée"})
+        self.assertEqual(S("café"), {"cafés", "cafée"})
+        self.assertEqual(S("épée"), {"épées", "épéement"})
+        self.assertEqual(S("éase"), {"éases"})
+        self.assertEqual(U("run"), {"unrun"})
+        self.assertEqual(U("lg"), {"unlg", "relg"})
+        self.assertEqual(U("été"), {"unété", "reété", "réété"})
+        self.assertEqual(U(""), {"un"})
+
+
+class TestGenWords(_DicTestCase):
+
+    NAME = "windows"
+
+    def test_windows(self):
+        full = list(self.h.gen_words())
+        lens = {len(w) for w in full}
+        for minlen in range(0, max(lens) + 3):
+            for maxlen in range(minlen + 1, max(lens) + 3):
+                windowed = list(self.h.gen_words(minlen=minlen,
+                                                 maxlen=maxlen))
+                self.assertEqual(
+                        sorted(windowed),
+                        sorted(w for w in full if minlen <= len(w) < maxlen),
+                        (minlen, maxlen))
+
+    def test_bounds(self):
+        full = list(self.h.gen_words())
+        # Upper bound is excluded.
+        for ln in (4, 11, 16):
+            words = {w for w in full if len(w) == ln}
+            self.assertTrue(words)
+            self.assertFalse(words & set(self.h.gen_words(minlen=ln - 1,
+                                                          maxlen=ln)))
+            self.assertEqual(set(self.h.gen_words(minlen=ln,
+                                                  maxlen=ln + 1)), words)
+        # Only one of them given.
+        self.assertEqual(sorted(self.h.gen_words(minlen=10)),
+                         sorted(w for w in full if len(w) >= 10))
+        self.assertEqual(sorted(self.h.gen_words(maxlen=10)),
+                         sorted(w for w in full if len(w) < 10))
+        self.assertEqual(sorted(self.h.gen_words(minlen=3, maxlen=12,
+                                                 unique=True)),
+                         sorted({w for w in full if 3 <= len(w) < 12}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,256 @@
+########################################################################
+#                                                                      #
+#   Cyprium is a multifunction cryptographic, steganographic and       #
+#   cryptanalysis tool developped by members of The Hackademy.         #
+#   French White Hat Hackers Community!                                #
+#   cyprium.hackademics.fr                                             #                                                  #
+#   Authors: SAKAROV, mont29, afranck64                                #
+#   Contact: admin@hackademics.fr                                      #
+#   Forum: hackademics.fr                                              #
+#   Twitter: @hackademics_                                             #
+#                                                                      #
+#   Cyprium is free software: you can redistribute it and/or modify    #
+#   it under the terms of the GNU General Public License as published  #
+#   by the Free Software Foundation, either version 3 of the License,  #
+#   or any later version.                                              #
+#                                                                      #
+#   This program is distributed in the hope that it will be useful,    #
+#   but without any warranty; without even the implied warranty of     #
+#   merchantability or fitness for a particular purpose. See the       #
+#   GNU General Public License for more details.                       #
+#                                                                      #
+#   The terms of the GNU General Public License is detailed in the     #
+#   COPYING attached file. If not, see : http://www.gnu.org/licenses   #
+#                                                                      #
+########################################################################
+
+
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+
+import kernel.cache as cache
+import kernel.matchdic as matchdic
+import kernel.dicbundle as dicbundle
+
+
+class TestSortedWords(unittest.TestCase):
+
+    WORDS = ["abc", "abd", "été", "über", "ab", "a", "日本語", "zzz", "é"]
+
+    def _check(self, sw, words):
+        self.assertEqual(len(sw), len(words))
+        self.assertEqual(sorted(sw), sorted(words))
+        for w in words:
+            self.assertIn(w, sw)
+        for w in ("", "b", "abe", "aa", "ét", "étée", "日本", "日本語語", "zzzz",
+                  "\0", "a\0", "\xff", "ż"):
+            if w not in words:
+                self.assertNotIn(w, sw)
+
+    def test_words(self):
+        self._check(matchdic.SortedWords(self.WORDS), self.WORDS)
+
+    def test_empty(self):
+        sw = matchdic.SortedWords()
+        self._check(sw, [])
+        self.assertEqual(sw.width, 0)
+        self._check(matchdic.SortedWords.from_sorted([]), [])
+
+    def test_probe_widths(self):
+        # Probes longer (in chars or bytes) or shorter than the width.
+        sw = matchdic.SortedWords(["éé", "ab"])
+        self.assertEqual(sw.width, 4)
+        for w in ("a", "é", "abcd", "abcde", "ééé", "ab\0\0", "éé\0"):
+            self.assertNotIn(w, sw)
+        self.assertIn("ab", sw)
+        self.assertIn("éé", sw)
+
+    def test_pickle(self):
+        sw = pickle.loads(pickle.dumps(matchdic.SortedWords(self.WORDS)))
+        self._check(sw, self.WORDS)
+
+    def test_from_sorted(self):
+        words = sorted(w.encode("utf-8") for w in self.WORDS)
+        self._check(matchdic.SortedWords.from_sorted(words), self.WORDS)
+        sw = matchdic.SortedWords.from_sorted(words, 12)
+        self.assertEqual(sw.width, 12)
+        self._check(sw, self.WORDS)
+
+    def test_from_buffer(self):
+        words = sorted(w.encode("utf-8") for w in self.WORDS)
+        ref = matchdic.SortedWords.from_sorted(words, 12)
+        buf = b"junk" + ref.to_buffer() + b"junk"
+        sw = matchdic.SortedWords.from_buffer(buf, 4, 12, ref.ranges)
+        self._check(sw, self.WORDS)
+        self.assertEqual(sw.to_buffer(), ref.to_buffer())
+        sw = pickle.loads(pickle.dumps(sw))
+        self.assertEqual(sw.offset, 0)
+        self._check(sw, self.WORDS)
+
+
+class TestScoreMany(unittest.TestCase):
+
+    def setUp(self):
+        self.m = matchdic.MatchDic(None)
+        self.m.set_params(func=str.lower)
+
+    def _load(self):
+        self.m.ids["aa"] = self.m._bucket_words(["hello", "world"])
+        self.m.ids["bb"] = self.m._bucket_words(["bonjour", "monde"])
+
+    def test_no_dics(self):
+        for best_only in (False, True):
+            self.assertEqual(self.m.score_many(["abc", "def"],
+                                               best_only=best_only),
+                             [{}, {}])
+        self.assertEqual(self.m.find_best_dic("abc"), {})
+
+    def test_empty_ids(self):
+        self._load()
+        for best_only in (False, True):
+            self.assertEqual(self.m.score_many(["hello world"], ids=[],
+                                               best_only=best_only), [{}])
+
+    def test_best_only(self):
+        self._load()
+        res = self.m.score_many(["hello world", "bonjour monde"],
+                                best_only=True)
+        self.assertEqual([max(r, key=r.get) for r in res], ["aa", "bb"])
+        self.assertEqual(res[0]["aa"], 1.0)
+        self.assertEqual(res[1]["bb"], 1.0)
+
+
+class TestMatchLevel(unittest.TestCase):
+
+    def _dic(self, words):
+        m = matchdic.MatchDic(None)
+        m.set_params(func=str.lower)
+        m.ids["aa"] = m._bucket_words(words)
+        return m
+
+    def test_find(self):
+        m = self._dic(["abc", "cde", "xy", "e"])
+        idx = matchdic.WordsIndex(m.ids["aa"])
+        self.assertEqual(idx.find("abcde"), [(3, 0), (3, 2), (1, 4)])
+        self.assertEqual(idx.find("xyz"), [(2, 0)])
+        self.assertEqual(idx.find("zzz"), [])
+
+    def test_overlapping(self):
+        m = self._dic(["abc", "cde", "xy"])
+        # Longest leftmost "abc" is kept, leaving an unmatched "de".
+        self.assertEqual(m._get_scoria("aa", "abcde"), 2)
+        self.assertEqual(m.get_match_level("aa", "abcde"), 3 / 5)
+        m = self._dic(["abc", "bcde"])
+        # Longer "bcde" wins over leftmost "abc".
+        self.assertEqual(m._get_scoria("aa", "abcde"), 1)
+        self.assertEqual(m.get_match_level("aa", "abcde"), 4 / 5)
+
+    def test_final_position(self):
+        m = self._dic(["cat", "a", "bb"])
+        self.assertEqual(m.get_match_level("aa", "xcat"), 3 / 4)
+        self.assertEqual(m.get_match_level("aa", "bba"), 1.0)
+        self.assertEqual(m.get_match_level("aa", "xa"), 1 / 2)
+        self.assertEqual(m.get_match_level("aa", "catbba"), 1.0)
+
+    def test_unmatched_tail(self):
+        m = self._dic(["hello", "abcdef", "abc"])
+        self.assertEqual(m.get_match_level("aa", "helloxyz"), 5 / 8)
+        self.assertEqual(m.get_match_level("aa", "abcdefg"), 6 / 7)
+        # Whitespaces count as matched.
+        self.assertEqual(m.get_match_level("aa", "Hello xyz"), 6 / 9)
+        self.assertEqual(m.find_best_dic("Hello xyz"), {"aa": 6 / 9})
+
+
+class TestWordsUnion(unittest.TestCase):
+
+    def test_contains(self):
+        u = matchdic.WordsUnion({"abc", "abd"}, set(), {"abe"})
+        for w in ("abc", "abd", "abe"):
+            self.assertIn(w, u)
+        self.assertNotIn("abf", u)
+        self.assertNotIn("", u)
+
+    def test_iter(self):
+        u = matchdic.WordsUnion({"abc", "abd"}, {"abd", "abe"},
+                                matchdic.SortedWords(["abe", "abf"]))
+        self.assertEqual(sorted(u), ["abc", "abd", "abe", "abf"])
+        # Can be iterated several times.
+        self.assertEqual(sorted(u), ["abc", "abd", "abe", "abf"])
+
+
+class TestUserWords(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix="cyprium-test-")
+        self.cache = cache.DiskCache(os.path.join(self.dir, "cache"))
+        self.prev = cache.cache.swap(self.cache)
+        self.m = matchdic.MatchDic(None)
+        self.m.set_params(func=str.lower)
+        self.m.ids["aa"] = self.m._bucket_words(["hello", "world"])
+
+    def tearDown(self):
+        cache.cache.swap(self.prev)
+        self.cache.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def _write(self, name, words):
+        path = os.path.join(self.dir, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(words))
+        return path
+
+    def _user_keys(self):
+        return {k for k in self.cache._lru
+                if k[:2] == (matchdic.CACHE_PREFIX, "user")}
+
+    def test_add_user_words(self):
+        base = [set(s) for s in self.m.ids["aa"]]
+        self.assertLess(self.m.find_best_dic("hello xyzzy")["aa"], 1.0)
+        self.m.add_user_words("aa", self._write("u1", ["# Comment",
+                                                       "Xyzzy", "", "plugh"]))
+        self.assertEqual(self.m.find_best_dic("hello xyzzy")["aa"], 1.0)
+        self.assertEqual(self.m.find_best_dic("plugh world")["aa"], 1.0)
+        self.assertLess(self.m.find_best_dic("comment")["aa"], 1.0)
+        # Base words are left untouched.
+        self.assertEqual(self.m.ids["aa"], base)
+        # Several overlays can be stacked.
+        self.m.add_user_words("aa", self._write("u2", ["quux"]))
+        self.assertEqual(self.m.find_best_dic("quux xyzzy")["aa"], 1.0)
+
+    def test_cache_keys(self):
+        path = self._write("u1", ["xyzzy"])
+        self.m.add_user_words("aa", path)
+        keys = self._user_keys()
+        self.assertEqual(len(keys), 1)
+        # Only user words are cached (base ones are never rebuilt).
+        self.assertEqual(set(self.cache._lru), keys)
+        # Same words and params share the same entry.
+        m = matchdic.MatchDic(None)
+        m.set_params(func=str.lower)
+        m.add_user_words("bb", path)
+        self.assertEqual(self._user_keys(), keys)
+        # Other params or other words get their own.
+        m = matchdic.MatchDic(None)
+        m.set_params(func=str.upper)
+        m.add_user_words("aa", path)
+        self.assertEqual(len(self._user_keys()), 2)
+        self.m.add_user_words("aa", self._write("u1", ["xyzzy", "plugh"]))
+        self.assertEqual(len(self._user_keys()), 3)
+
+    def test_settings_paths(self):
+        user = {"aa": ("a1", "a2"), None: ["all"], "bb": "b1",
+                "cc": {"c1"}}
+        with unittest.mock.patch.object(dicbundle, "USER_DICS", user):
+            self.assertEqual(dicbundle.get_user_dics("aa"), ["a1", "a2"])
+            self.assertEqual(dicbundle.get_user_dics(None), ["all"])
+            self.assertEqual(dicbundle.get_user_dics("bb"), ["b1"])
+            self.assertEqual(dicbundle.get_user_dics("cc"), ["c1"])
+            self.assertEqual(dicbundle.get_user_dics("dd"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
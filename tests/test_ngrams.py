@@ -0,0 +1,91 @@
+########################################################################
+#                                                                      #
+#   Cyprium is a multifunction cryptographic, steganographic and       #
+#   cryptanalysis tool developped by members of The Hackademy.         #
+#   French White Hat Hackers Community!                                #
+#   cyprium.hackademics.fr                                             #                                                  #
+#   Authors: SAKAROV, mont29, afranck64                                #
+#   Contact: admin@hackademics.fr                                      #
+#   Forum: hackademics.fr                                              #
+#   Twitter: @hackademics_                                             #
+#                                                                      #
+#   Cyprium is free software: you can redistribute it and/or modify    #
+#   it under the terms of the GNU General Public License as published  #
+#   by the Free Software Foundation, either version 3 of the License,  #
+#   or any later version.                                              #
+#                                                                      #
+#   This program is distributed in the hope that it will be useful,    #
+#   but without any warranty; without even the implied warranty of     #
+#   merchantability or fitness for a particular purpose. See the       #
+#   GNU General Public License for more details.                       #
+#                                                                      #
+#   The terms of the GNU General Public License is detailed in the     #
+#   COPYING attached file. If not, see : http://www.gnu.org/licenses   #
+#                                                                      #
+########################################################################
+
+
+import unittest
+
+import kernel.matchdic as matchdic
+import kernel.ngrams as ngrams
+
+
+class TestPrefilter(unittest.TestCase):
+
+    TEXTS = ["zzqx", "Hello world", "bonjour monde", "held word", "helqx",
+             "bonqx"]
+
+    def setUp(self):
+        self.m = matchdic.MatchDic(None)
+        self.m.set_params(func=str.lower)
+        self.models = {
+            "en": ngrams.NGramModel(*ngrams.NGramModel.train(
+                                [{"hello", "world", "help", "held", "word"}])),
+            "fr": ngrams.NGramModel(*ngrams.NGramModel.train(
+                                [{"bonjour", "monde", "bon", "jour", "mode"}])),
+        }
+
+    def _prefilter(self, **kwargs):
+        return ngrams.prefilter(self.m, self.TEXTS, models=self.models,
+                                **kwargs)
+
+    def test_best_many(self):
+        res = ngrams.best_many(self.m, self.TEXTS, self.models)
+        self.assertEqual([uid for uid, sc in res[1:]],
+                         ["en", "fr", "en", "en", "fr"])
+        self.assertEqual([sc for uid, sc in res],
+                         ngrams.score_many(self.m, self.TEXTS, self.models))
+
+    def test_split(self):
+        keep, rejected = self._prefilter(ratio=0.5, minimum=0)
+        self.assertEqual(keep, [1, 2, 3])
+        self.assertEqual([i for i, uid in rejected], [4, 5, 0])
+        self.assertEqual(rejected[:2], [(4, "en"), (5, "fr")])
+        # The minimum wins over the ratio.
+        keep, rejected = self._prefilter(ratio=0.1, minimum=2)
+        self.assertEqual(keep, [2, 3])
+        self.assertEqual([i for i, uid in rejected], [1, 4, 5, 0])
+        self.assertEqual(rejected[0], (1, "en"))
+
+    def test_rejected_order(self):
+        scores = ngrams.score_many(self.m, self.TEXTS, self.models)
+        keep, rejected = self._prefilter(ratio=0.0, minimum=1)
+        self.assertEqual(len(keep) + len(rejected), len(self.TEXTS))
+        rej = [scores[i] for i, uid in rejected]
+        self.assertEqual(rej, sorted(rej, reverse=True))
+        self.assertGreaterEqual(min(scores[i] for i in keep), rej[0])
+
+    def test_keep_all(self):
+        every = list(range(len(self.TEXTS)))
+        self.assertEqual(self._prefilter(ratio=None), (every, []))
+        self.assertEqual(self._prefilter(ratio=0.1, minimum=6), (every, []))
+        self.assertEqual(self._prefilter(ratio=1.0, minimum=0), (every, []))
+        self.assertEqual(ngrams.prefilter(self.m, [], models=self.models),
+                         ([], []))
+        self.assertEqual(ngrams.prefilter(self.m, iter(self.TEXTS),
+                                          ratio=None), (every, []))
+
+
+if __name__ == "__main__":
+    unittest.main()